@@ -0,0 +1,220 @@
+import os
+import random
+import time
+from functools import partial
+
+from cardCatalog import card_catalog, CARD_TYPES, REGIONS, MADNESS_VALUES, TYPE_INDEX, REGION_INDEX
+from deck import Deck, MAX_COPIES
+
+DEFAULT_DECK_SIZE = 40
+DEFAULT_CANDIDATES = 3
+DEFAULT_TIME_BUDGET = 2.0
+# a required region with no cards costs as much as being this many cards away from the targets
+MISSING_REGION_PENALTY = 25.0
+# moves tried without improvement before the search restarts from a new random deck
+STALE_MOVES = 2000
+
+# Feature vector of a card: one-hot type, region and madness, laid out like this
+TYPE_OFFSET = 0
+REGION_OFFSET = TYPE_OFFSET + len(CARD_TYPES)
+MADNESS_OFFSET = REGION_OFFSET + len(REGIONS)
+FEATURES = MADNESS_OFFSET + len(MADNESS_VALUES)
+
+def card_features(card: dict) -> tuple[int, ...]:
+    features = [0] * FEATURES
+    features[TYPE_OFFSET + TYPE_INDEX[card["type"]]] = 1
+    features[REGION_OFFSET + REGION_INDEX[card["region"]]] = 1
+    features[MADNESS_OFFSET + card["madness"]] = 1
+    return tuple(features)
+
+# Constraints, every one optional:
+#   size: cards in the deck
+#   regions: only cards from these regions, each with at least one card
+#   madness_curve: weight of every madness value (MADNESS_VALUES order), scaled to the deck size
+#   type_ratios: {type: fraction of the deck}
+#   must_include: {card id: copies}
+#   max_copies: copies allowed per card
+#
+# The score only depends on how many cards of each (type, region, madness) the deck has, so the search
+# runs over those classes (at most 126) instead of single cards, and cards are picked per class at the end
+def build_problem(constraints: dict) -> dict:
+    size = constraints.get("size", DEFAULT_DECK_SIZE)
+    max_copies = constraints.get("max_copies", MAX_COPIES)
+    regions = constraints.get("regions") or []
+    must_include = {card_id: min(quantity, max_copies) for card_id, quantity in (constraints.get("must_include") or {}).items()}
+    cards = [card for card in card_catalog.all_cards()
+             if not regions or card["region"] in regions or card["id"] in must_include]
+    missing = [card_id for card_id in must_include if card_catalog.get(card_id) is None]
+    if missing:
+        raise ValueError(f"Unknown cards: {', '.join(map(str, missing))}")
+
+    features = sorted({card_features(card) for card in cards})
+    class_of = {feature: i for i, feature in enumerate(features)}
+    capacity = [0] * len(features)
+    minimum = [0] * len(features)
+    for card in cards:
+        capacity[class_of[card_features(card)]] += max_copies
+    for card_id, quantity in must_include.items():
+        minimum[class_of[card_features(card_catalog.get(card_id))]] += quantity
+    if sum(minimum) > size:
+        raise ValueError(f"The must include cards ({sum(minimum)}) do not fit in a deck of {size}")
+    if sum(capacity) < size:
+        raise ValueError(f"Only {sum(capacity)} cards match the constraints, not enough for a deck of {size}")
+
+    # target count of every feature, None where there is no target
+    targets = [None] * FEATURES
+    curve = constraints.get("madness_curve")
+    if curve:
+        for madness, weight in zip(MADNESS_VALUES, curve):
+            targets[MADNESS_OFFSET + madness] = size * weight / sum(curve)
+    for card_type, ratio in (constraints.get("type_ratios") or {}).items():
+        targets[TYPE_OFFSET + TYPE_INDEX[card_type]] = size * ratio
+    return {
+        "size": size,
+        "features": features,
+        "capacity": capacity,
+        "minimum": minimum,
+        "targets": targets,
+        "required_regions": [REGION_OFFSET + REGION_INDEX[region] for region in regions],
+        "must_include": must_include,
+        "max_copies": max_copies,
+        "regions": regions,
+    }
+
+def score(problem: dict, totals: list[int]) -> float:
+    error = 0.0
+    for target, total in zip(problem["targets"], totals):
+        if target is not None:
+            error += (total - target) ** 2
+    return error + MISSING_REGION_PENALTY * sum(1 for feature in problem["required_regions"] if totals[feature] == 0)
+
+def _totals(problem: dict, counts: list[int]) -> list[int]:
+    totals = [0] * FEATURES
+    for features, count in zip(problem["features"], counts):
+        if count:
+            for i, value in enumerate(features):
+                totals[i] += value * count
+    return totals
+
+def _random_counts(problem: dict, rng: random.Random) -> list[int]:
+    counts = list(problem["minimum"])
+    open_classes = [i for i, capacity in enumerate(problem["capacity"]) for _ in range(capacity - counts[i])]
+    for i in rng.sample(open_classes, problem["size"] - sum(counts)):
+        counts[i] += 1
+    return counts
+
+# Local search from random starting decks: move one card from a class to another when it lowers the score,
+# restart after STALE_MOVES moves without improvement, until the deadline. Returns the best decks found
+# as (score, class counts), at most `keep` of them
+def local_search(problem: dict, seed: int, seconds: float, keep: int = DEFAULT_CANDIDATES) -> list[tuple[float, tuple[int, ...]]]:
+    rng = random.Random(seed)
+    deadline = time.monotonic() + seconds
+    features = problem["features"]
+    classes = range(len(features))
+    best: dict[tuple[int, ...], float] = {}
+    while True:
+        counts = _random_counts(problem, rng)
+        totals = _totals(problem, counts)
+        current = score(problem, totals)
+        stale = 0
+        while stale < STALE_MOVES:
+            source = rng.choice(classes)
+            target = rng.choice(classes)
+            if source == target or counts[source] <= problem["minimum"][source] or counts[target] >= problem["capacity"][target]:
+                stale += 1
+                continue
+            moved = [total - removed + added for total, removed, added in zip(totals, features[source], features[target])]
+            moved_score = score(problem, moved)
+            if moved_score < current:
+                counts[source] -= 1
+                counts[target] += 1
+                totals = moved
+                current = moved_score
+                stale = 0
+            else:
+                stale += 1
+            if stale % 256 == 0 and time.monotonic() > deadline:
+                break
+        best[tuple(counts)] = current
+        if time.monotonic() > deadline:
+            return sorted(((value, counts) for counts, value in best.items()))[:keep]
+
+# Picks the cards of every class: the must include ones first, then whole playsets of random cards
+def materialize(problem: dict, counts: tuple[int, ...], name: str, seed: int = None) -> Deck:
+    rng = random.Random(seed)
+    deck = Deck(name)
+    remaining = list(counts)
+    class_of = {features: i for i, features in enumerate(problem["features"])}
+    for card_id, quantity in problem["must_include"].items():
+        card = card_catalog.get(card_id)
+        remaining[class_of[card_features(card)]] -= deck.add(card, quantity, problem["max_copies"])
+    cards_by_class: dict[int, list[dict]] = {}
+    for card in card_catalog.all_cards():
+        if not problem["regions"] or card["region"] in problem["regions"] or card["id"] in problem["must_include"]:
+            cards_by_class.setdefault(class_of.get(card_features(card)), []).append(card)
+    for i, count in enumerate(remaining):
+        cards = cards_by_class.get(i, [])
+        rng.shuffle(cards)
+        for card in cards:
+            if count <= 0:
+                break
+            count -= deck.add(card, count, problem["max_copies"])
+    return deck
+
+# Runs one local search per worker (in a process pool when there is more than one) for `seconds`,
+# and returns the best distinct candidates as (score, Deck), best first
+def build_decks(constraints: dict, name: str, candidates: int = DEFAULT_CANDIDATES, seconds: float = DEFAULT_TIME_BUDGET,
+                workers: int = None, seed: int = None) -> list[tuple[float, Deck]]:
+    problem = build_problem(constraints)
+    workers = workers or os.cpu_count() or 1
+    seeds = [random.Random(seed).randrange(2**32) + worker for worker in range(workers)]
+    search = partial(local_search, problem, seconds=seconds, keep=candidates)
+    if workers == 1:
+        results = [search(seeds[0])]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(search, seeds))
+    best = {}
+    for result in results:
+        for value, counts in result:
+            best[counts] = min(value, best.get(counts, value))
+    ranked = sorted((value, counts) for counts, value in best.items())[:candidates]
+    return [(value, materialize(problem, counts, name, seeds[0] + rank)) for rank, (value, counts) in enumerate(ranked)]
+
+# "4,8,10,8,6,4": weight of every madness value
+def parse_madness_curve(text: str) -> list[float]:
+    curve = [float(weight) for weight in text.split(",") if weight.strip()]
+    if len(curve) != len(MADNESS_VALUES) or min(curve) < 0 or sum(curve) == 0:
+        raise ValueError(f"Invalid madness curve '{text}', expected {len(MADNESS_VALUES)} comma separated weights")
+    return curve
+
+# "creature=0.6,event=0.2"
+def parse_type_ratios(text: str) -> dict[str, float]:
+    ratios = {}
+    for item in text.split(","):
+        card_type, _, ratio = item.partition("=")
+        if card_type.strip() not in CARD_TYPES:
+            raise ValueError(f"Invalid card type in '{item}', expected one of {', '.join(CARD_TYPES)}")
+        ratios[card_type.strip()] = float(ratio)
+    return ratios
+
+def parse_regions(text: str) -> list[str]:
+    regions = [region.strip() for region in text.split(",") if region.strip()]
+    for region in regions:
+        if region not in REGIONS:
+            raise ValueError(f"Invalid region '{region}', expected one of {', '.join(REGIONS)}")
+    return regions
+
+# "Card name:2" (2 copies) or "Card name" (1 copy), returns (card id, copies)
+def parse_card_quantity(text: str) -> tuple[int, int]:
+    card_name, _, quantity = text.rpartition(":")
+    if not card_name or not quantity.strip().isdigit():
+        card_name, quantity = text, "1"
+    card = card_catalog.find_by_name(card_name)
+    if card is None:
+        from cardNameIndex import get_card_name_index
+        suggestions = get_card_name_index().suggest(card_name, 3)
+        hint = f", did you mean {' or '.join(repr(card['name']) for card, _ in suggestions)}?" if suggestions else ""
+        raise ValueError(f"Card '{card_name.strip()}' not found{hint}")
+    return card["id"], int(quantity)
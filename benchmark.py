@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable
+
+import database
+import repository
+import bulkImport
+import deckSimilarity
+import cardNameIndex
+import libraryExport
+from cardCatalog import card_catalog, CARD_TYPES, REGIONS, MADNESS_VALUES
+
+# Same tables as the shipped cards.db before any migration, the migrations run on top of them
+BASE_SCHEMA = [
+    'CREATE TABLE cards (id INTEGER CONSTRAINT pk_tasks PRIMARY KEY ASC AUTOINCREMENT, name TEXT NOT NULL, type TEXT NOT NULL, region TEXT NOT NULL, effect TEXT NOT NULL, madness INTEGER NOT NULL, rarity INTEGER NOT NULL, power INTEGER)',
+    'CREATE TABLE decks (id INTEGER CONSTRAINT pk_decks PRIMARY KEY ASC AUTOINCREMENT, name TEXT NOT NULL, wins INTEGER NOT NULL DEFAULT 0, games INTEGER NOT NULL DEFAULT 0)',
+    '''CREATE TABLE deck_cards (id INTEGER CONSTRAINT pk_deck_cards PRIMARY KEY ASC AUTOINCREMENT,
+       deck_id INTEGER NOT NULL, card_id INTEGER NOT NULL, quantity INTEGER NOT NULL, CONSTRAINT fk_decks_cards__decks FOREIGN KEY (deck_id) REFERENCES decks (id)
+       CONSTRAINT fk_deck_cards__cards FOREIGN KEY (card_id) REFERENCES cards (id))''',
+]
+
+NAME_WORDS = ["Shackled", "Forbidden", "Drowned", "Crawling", "Ascending", "Feral", "Cosmic", "Grave", "Burning", "Hidden",
+              "Devourer", "Archives", "Tutor", "Savant", "Globe", "Hound", "Reef", "Cleric", "Trap", "Swamp"]
+EFFECT_WORDS = ["draw", "card", "cards", "discard", "madness", "insanity", "creature", "target", "opponent", "reveal",
+                "shroud", "gain", "return", "hand", "deck", "destroy", "turn", "round", "permanent", "event"]
+
+DEFAULT_FILTERS = [
+    {"name": "", "type": ["creature"], "region": [], "power": [{"condition": ">", "value": 2}], "madness": [], "effect": ""},
+    {"name": "", "type": [], "region": ["town", "forest"], "power": [], "madness": [{"condition": "<", "value": 3}], "effect": ""},
+    {"name": "", "type": [], "region": [], "power": [], "madness": [], "effect": "draw card"},
+    {"name": "shack", "type": [], "region": [], "power": [], "madness": [], "effect": ""},
+]
+
+# Cold start budgets: `import main` is what the menu pays before showing anything, and a scripted command
+# (`python main.py <command>`) imports cli on top of it. Measured with `python -X importtime` and checked against
+# the fastest run, since the others mostly measure noise. LAZY_MODULES must only be imported when first used
+STARTUP_BUDGET_MS = 80
+SCRIPTED_STARTUP_BUDGET_MS = 100
+STARTUP_MODULES = {"menu": ["main"], "scripted": ["main", "cli"]}
+LAZY_MODULES = ["prettytable", "multiprocessing", "numpy", "bulkImport", "libraryExport", "cardStore", "cardNameIndex",
+                "autoBuilder", "drawOdds", "deckSimilarity"]
+
+# Returns the cumulative import time in microseconds of every module imported by `import modules`
+def import_times(modules: list[str]) -> dict[str, int]:
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+def measure_startup(runs: int, budgets_ms: dict[str, float]) -> dict:
+    results = {}
+    for kind, modules in STARTUP_MODULES.items():
+        totals = []
+        for _ in range(runs):
+            times = import_times(modules)
+            totals.append(sum(times[module] for module in modules) / 1000)
+        eager = [module for module in LAZY_MODULES if module in times]
+        startup = {
+            "modules": modules,
+            "runs": runs,
+            "median_ms": statistics.median(totals),
+            "min_ms": min(totals),
+            "budget_ms": budgets_ms[kind],
+            "eager_modules": eager,
+            "slowest_imports_ms": {name: value / 1000 for name, value in sorted(times.items(), key=lambda item: -item[1])[:12] if name not in modules},
+        }
+        startup["within_budget"] = startup["min_ms"] <= budgets_ms[kind] and not eager
+        print(f"import {', '.join(modules)} ({kind}): median {startup['median_ms']:.1f} ms (min {startup['min_ms']:.1f} ms) over {runs} runs, "
+              f"budget {budgets_ms[kind]} ms", file=sys.stderr)
+        if eager:
+            print("Imported at startup but should be lazy: " + ", ".join(eager), file=sys.stderr)
+        results[kind] = startup
+    results["within_budget"] = all(startup["within_budget"] for startup in results.values())
+    return results
+
+def generate_database(db_file_name: str, cards: int, decks: int, cards_per_deck: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    if os.path.exists(db_file_name):
+        os.remove(db_file_name)
+    conn = sqlite3.connect(db_file_name)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    for statement in BASE_SCHEMA:
+        conn.execute(statement)
+    with conn:
+        conn.executemany('INSERT INTO cards (name, type, region, effect, madness, rarity, power) VALUES (?, ?, ?, ?, ?, ?, ?)', (
+            (f"{rng.choice(NAME_WORDS)} {rng.choice(NAME_WORDS)} {i}", card_type, rng.choice(REGIONS),
+             " ".join(rng.choices(EFFECT_WORDS, k=rng.randint(3, 25))), rng.choice(MADNESS_VALUES), rng.randint(0, 3),
+             rng.randint(1, 6) if card_type == "creature" else None)
+            for i, card_type in ((i, rng.choice(CARD_TYPES)) for i in range(1, cards + 1))))
+        conn.executemany('INSERT INTO decks (name, wins, games) VALUES (?, ?, ?)', (
+            (f"Deck {i}", wins, wins + rng.randint(0, 20)) for i, wins in ((i, rng.randint(0, 20)) for i in range(1, decks + 1))))
+        cards_per_deck = min(cards_per_deck, cards)
+        conn.executemany('INSERT INTO deck_cards (deck_id, card_id, quantity) VALUES (?, ?, ?)', (
+            (deck_id, card_id, rng.randint(1, 2))
+            for deck_id in range(1, decks + 1) for card_id in rng.sample(range(1, cards + 1), cards_per_deck)))
+    conn.close()
+
+def measure(name: str, func: Callable, args_list: list, results: dict) -> None:
+    timings = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    results[name] = {
+        "calls": len(timings),
+        "total_s": sum(timings),
+        "mean_ms": 1000 * statistics.fmean(timings),
+        "p50_ms": 1000 * timings[len(timings) // 2],
+        "p95_ms": 1000 * timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "max_ms": 1000 * timings[-1],
+    }
+    print(f"{name:<44} {results[name]['calls']:>6} calls  mean {results[name]['mean_ms']:10.3f} ms  p95 {results[name]['p95_ms']:10.3f} ms", file=sys.stderr)
+
+def run_benchmarks(samples: int, seed: int = 0) -> dict:
+    import main
+    rng = random.Random(seed)
+    conn = database.get_connection()
+    deck_ids = [row[0] for row in conn.execute("SELECT id FROM decks")]
+    card_names = [card["name"] for card in card_catalog.refresh().all_cards()]
+    sample_decks = [(rng.choice(deck_ids),) for _ in range(samples)] if deck_ids else []
+    sample_names = [(rng.choice(card_names).upper(),) for _ in range(samples)]
+    results = {}
+
+    measure("print_all_decks query", lambda: conn.execute(repository.ALL_DECKS_QUERY).fetchall(), [()] * max(1, samples // 20), results)
+    measure("get_deck_analysis_by_id", repository.get_deck_analysis_by_id, sample_decks, results)
+    measure("get_deck_analyses_by_ids (100 ids)", repository.get_deck_analyses_by_ids,
+            [([deck_id for (deck_id,) in rng.sample(sample_decks, min(100, len(sample_decks)))],) for _ in range(max(1, samples // 20))], results)
+    measure("get_cards_for_deck_id", repository.get_cards_for_deck_id, sample_decks, results)
+    measure("register_win_for_deck (write-behind)", repository.register_win_for_deck, sample_decks, results)
+    measure("card_catalog.find_by_name", card_catalog.find_by_name, sample_names, results)
+    measure("name lookup via lower(name) SQL", lambda name: conn.execute('SELECT * FROM cards WHERE lower(name) = ? LIMIT 1', (name.lower(),)).fetchone(),
+            sample_names, results)
+    typos = [(name[:len(name) // 2] + name[len(name) // 2 + 1:],) for (name,) in sample_names]
+    measure("card name index build", lambda: cardNameIndex.CardNameIndex(card_catalog.all_cards()), [()], results)
+    measure("fuzzy card name suggestions (one typo)", cardNameIndex.get_card_name_index().suggest, typos, results)
+    for engine in ("sqlite", "memory"):
+        repository.FILTER_ENGINE = engine
+        measure(f"query_card_list_with_params ({engine})", lambda params: list(repository.search_cards(params)[1]),
+                [(rng.choice(DEFAULT_FILTERS),) for _ in range(max(1, samples // 5))], results)
+    repository.FILTER_ENGINE = "sqlite"
+
+    if deckSimilarity.numpy_available() and deck_ids:
+        measure("deck similarity index build", lambda: (deckSimilarity.deck_index.invalidate(), deckSimilarity.deck_index._ensure_loaded()), [()], results)
+        for metric in deckSimilarity.METRICS:
+            measure(f"similar decks ({metric}, top 10)", deckSimilarity.deck_index.similar_to_deck,
+                    [(deck_id, 10, metric) for (deck_id,) in sample_decks[:max(1, samples // 10)]], results)
+
+    card_ids = [card["id"] for card in card_catalog.all_cards()]
+    new_decks = [(f"Benchmark deck {rng.random()}", {card_id: rng.randint(1, 2) for card_id in rng.sample(card_ids, min(40, len(card_ids)))})
+                 for _ in range(samples)]
+    measure("save_deck (new deck)", repository.save_deck, new_decks, results)
+    edited_decks = [(name, dict(list(quantities.items())[1:]) | {rng.choice(card_ids): 1}) for name, quantities in new_decks]
+    measure("save_deck (one card edited)", repository.save_deck, edited_decks, results)
+    measure("find identical deck (content hash)", repository.find_identical_deck_id, [(quantities,) for _, quantities in edited_decks], results)
+
+    with tempfile.TemporaryDirectory() as folder:
+        # the first card of every file is misspelled, so the fuzzy name resolution is timed too
+        for i, (name, quantities) in enumerate(new_decks):
+            with open(os.path.join(folder, f"deck{i}.untap.txt"), "w") as file:
+                file.write(f"//Imported {name}\n")
+                for j, (card_id, quantity) in enumerate(quantities.items()):
+                    card_name = card_catalog.get(card_id)['name']
+                    file.write(f"{quantity} {card_name[0] + card_name[2:] if j == 0 else card_name} (se1)\n")
+        measure("import_untap_file (one file)", main.import_untap_file,
+                [(file_name,) for file_name in bulkImport.find_deck_files(folder)], results)
+        measure("bulk import (whole folder)", lambda: bulkImport.import_decks(folder, workers=1), [()], results)
+        for export_format in libraryExport.FORMATS:
+            measure(f"export library ({export_format})", libraryExport.export_library,
+                    [(os.path.join(folder, f"library-{export_format}"), export_format)], results)
+    return results
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None or previous["mean_ms"] == 0:
+            continue
+        ratio = result["mean_ms"] / previous["mean_ms"]
+        print(f"{name:<44} {previous['mean_ms']:10.3f} ms -> {result['mean_ms']:10.3f} ms ({ratio:.2f}x)", file=sys.stderr)
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the deck builder hot paths on a synthetic database")
+    parser.add_argument("--cards", type=int, default=5000)
+    parser.add_argument("--decks", type=int, default=10000)
+    parser.add_argument("--cards-per-deck", type=int, default=40)
+    parser.add_argument("--samples", type=int, default=200, help="calls measured per hot path")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", default="benchmark.db", help="synthetic database file (recreated unless --reuse)")
+    parser.add_argument("--reuse", action="store_true", help="reuse the existing synthetic database")
+    parser.add_argument("--output", default=None, help="JSON file for the results (default: stdout)")
+    parser.add_argument("--baseline", default=None, help="previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline (0.25 = 25%%)")
+    parser.add_argument("--startup", action="store_true", help="only check the cold start import time against the budget")
+    parser.add_argument("--startup-runs", type=int, default=7)
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET_MS, help="budget in ms for the fastest `import main`")
+    parser.add_argument("--scripted-startup-budget", type=float, default=SCRIPTED_STARTUP_BUDGET_MS,
+                        help="budget in ms for the fastest `import main, cli`")
+    args = parser.parse_args()
+
+    if args.startup:
+        startup = measure_startup(args.startup_runs, {"menu": args.startup_budget, "scripted": args.scripted_startup_budget})
+        print(json.dumps({"environment": {"python": platform.python_version(), "platform": platform.platform()}, "startup": startup}, indent=2))
+        sys.exit(0 if startup["within_budget"] else 1)
+
+    if not args.reuse or not os.path.exists(args.db):
+        start = time.perf_counter()
+        generate_database(args.db, args.cards, args.decks, args.cards_per_deck, args.seed)
+        print(f"Generated {args.db} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    database.use_database(args.db)
+    start = time.perf_counter()
+    database.get_connection()
+    migration_seconds = time.perf_counter() - start
+
+    report = {
+        "scale": {"cards": args.cards, "decks": args.decks, "cards_per_deck": args.cards_per_deck, "samples": args.samples},
+        "environment": {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "platform": platform.platform()},
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "open_and_migrate_s": migration_seconds,
+        "results": run_benchmarks(args.samples, args.seed),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report["results"], json.load(file), args.tolerance)
+        if regressions:
+            print("Regressions: " + ", ".join(regressions), file=sys.stderr)
+            sys.exit(1)
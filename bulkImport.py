@@ -0,0 +1,217 @@
+import argparse
+import glob
+import os
+import time
+from typing import Iterable, Iterator
+
+import repository
+from database import get_connection
+from cardCatalog import card_catalog, normalize_card_name
+from deck import MAX_COPIES
+from deckSimilarity import deck_index
+from deckCode import content_hash
+from cardNameIndex import get_card_name_index, AUTO_ACCEPT_SIMILARITY
+
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_CHUNK_SIZE = 32
+# below this many files the process pool costs more than it saves
+MIN_FILES_FOR_POOL = 16
+
+# name -> card id snapshot used by the worker processes
+_card_ids_by_name: dict[str, int] = {}
+
+def find_deck_files(path_or_glob: str) -> list[str]:
+    if os.path.isdir(path_or_glob):
+        return sorted(glob.glob(os.path.join(path_or_glob, "**", "*.txt"), recursive=True))
+    return sorted(glob.glob(path_or_glob, recursive=True))
+
+# Parses a single untap line ("2 Portcullis (se1)") into (quantity, card name), or None if it isn't a card line
+def parse_untap_line(line: str) -> tuple[int, str] | None:
+    line = line.strip()
+    if line == "" or line.startswith("//"):
+        return None
+    quantity, _, rest = line.partition(" ")
+    try:
+        quantity = int(quantity)
+    except ValueError:
+        return None
+    return quantity, rest.split("(")[0].strip()
+
+def deck_name_from_file_name(file_name: str) -> str:
+    name = os.path.basename(file_name)
+    for suffix in (".txt", ".untap"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+# Reads the file line by line and resolves every card against the catalog snapshot.
+# Returns a dict with the deck name, {card id: quantity}, its content hash, and the merged and skipped card names
+def parse_untap_file(file_name: str, card_ids_by_name: dict[str, int] = None) -> dict:
+    card_ids_by_name = _card_ids_by_name if card_ids_by_name is None else card_ids_by_name
+    deck = {"file": file_name, "name": None, "cards": {}, "merged": [], "skipped": [], "unresolved": [], "error": None}
+    try:
+        with open(file_name, "r", encoding="utf-8-sig") as file:
+            for line in file:
+                if deck["name"] is None and line.startswith("//"):
+                    deck["name"] = line.replace("//", "").strip()
+                    continue
+                parsed = parse_untap_line(line)
+                if parsed is None:
+                    continue
+                quantity, card_name = parsed
+                card_id = card_ids_by_name.get(normalize_card_name(card_name))
+                if card_id is None:
+                    deck["skipped"].append(card_name)
+                    deck["unresolved"].append((card_name, quantity))
+                else:
+                    _add_card(deck, card_id, quantity, card_name)
+    except (OSError, UnicodeDecodeError) as e:
+        deck["error"] = str(e)
+        deck["cards"] = {}
+    if not deck["name"]:
+        deck["name"] = deck_name_from_file_name(file_name)
+    deck["hash"] = content_hash(deck["cards"])
+    return deck
+
+def _add_card(deck: dict, card_id: int, quantity: int, card_name: str) -> None:
+    if card_id in deck["cards"]:
+        deck["cards"][card_id] = min(max(deck["cards"][card_id], quantity), MAX_COPIES)
+        deck["merged"].append(card_name)
+    else:
+        deck["cards"][card_id] = min(quantity, MAX_COPIES)
+
+# Replaces the card names that were not found by the most similar card name, when it is similar enough
+# (see cardNameIndex.py). Runs in the main process on the few unknown names, each resolved once per import
+def correct_card_names(deck: dict, resolved: dict[str, tuple | None], threshold: float, report: dict) -> None:
+    corrected = False
+    for card_name, quantity in deck["unresolved"]:
+        if card_name not in resolved:
+            resolved[card_name] = get_card_name_index().resolve(card_name, threshold)
+        match = resolved[card_name]
+        if match is None:
+            continue
+        card, _ = match
+        _add_card(deck, card["id"], quantity, card_name)
+        deck["skipped"].remove(card_name)
+        report["corrected"][card_name] = card["name"]
+        corrected = True
+    if corrected:
+        deck["hash"] = content_hash(deck["cards"])
+
+def _init_worker(card_ids_by_name: dict[str, int]) -> None:
+    global _card_ids_by_name
+    _card_ids_by_name = card_ids_by_name
+
+def parse_deck_files(file_names: list[str], card_ids_by_name: dict[str, int], workers: int = None) -> Iterator[dict]:
+    if len(file_names) < MIN_FILES_FOR_POOL or workers == 1:
+        for file_name in file_names:
+            yield parse_untap_file(file_name, card_ids_by_name)
+        return
+    # imported here since it pulls in multiprocessing, which only the parallel path needs
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(card_ids_by_name,)) as executor:
+        yield from executor.map(parse_untap_file, file_names, chunksize=DEFAULT_CHUNK_SIZE)
+
+# Writes the parsed decks in transactions of batch_size decks, updating and returning the report.
+# Decks with the same cards as a stored deck (whatever its name) are not written again.
+# Unknown card names are replaced by similar ones above fuzzy_threshold, None turns that off
+def write_decks(decks: Iterable[dict], report: dict, batch_size: int = DEFAULT_BATCH_SIZE,
+                fuzzy_threshold: float | None = AUTO_ACCEPT_SIMILARITY) -> dict:
+    conn = get_connection()
+    batch = []
+    resolved = {}
+    used_names = set()
+    for deck in decks:
+        report["files"] += 1
+        if fuzzy_threshold is not None and deck["unresolved"]:
+            correct_card_names(deck, resolved, fuzzy_threshold, report)
+        report["merged"] += len(deck["merged"])
+        report["skipped"] += len(deck["skipped"])
+        for card_name in deck["skipped"]:
+            report["skipped_cards"][card_name] = report["skipped_cards"].get(card_name, 0) + 1
+        if deck["error"]:
+            report["unreadable"].append(deck["file"])
+            continue
+        if not deck["cards"]:
+            report["empty_decks"].append(deck["file"])
+            continue
+        unique_name = unique_deck_name(deck["name"], used_names)
+        if unique_name != deck["name"]:
+            report["renamed"][deck["file"]] = unique_name
+            deck["name"] = unique_name
+        batch.append(deck)
+        if len(batch) >= batch_size:
+            _write_batch(conn, batch, report)
+            batch = []
+    if batch:
+        _write_batch(conn, batch, report)
+    return report
+
+# Decks are saved by name (case insensitive), so two files of one import with the same deck name
+# (e.g. 'Aggro.txt' and 'aggro.txt', or one name in two folders) get ' (2)', ' (3)'... instead of overwriting each other.
+# Only the names of this import count, so importing the same folder again updates the same decks
+def unique_deck_name(name: str, used_names: set[str]) -> str:
+    unique_name = name
+    copy = 2
+    while unique_name.casefold() in used_names:
+        unique_name = f"{name} ({copy})"
+        copy += 1
+    used_names.add(unique_name.casefold())
+    return unique_name
+
+def _write_batch(conn, batch: list[dict], report: dict) -> None:
+    written = []
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for deck in batch:
+            identical_deck_id = repository.find_deck_id_by_content_hash(conn, deck["hash"])
+            if identical_deck_id is not None:
+                report["duplicates"][deck["file"]] = identical_deck_id
+                continue
+            written.append((repository.write_deck(conn, deck["name"], deck["cards"], deck["hash"]), deck["cards"]))
+            report["decks"] += 1
+            report["cards"] += sum(deck["cards"].values())
+    for deck_id, card_quantities in written:
+        deck_index.update(deck_id, card_quantities)
+
+def import_decks(path_or_glob: str, workers: int = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                 fuzzy_threshold: float | None = AUTO_ACCEPT_SIMILARITY) -> dict:
+    start = time.perf_counter()
+    file_names = find_deck_files(path_or_glob)
+    card_ids_by_name = {name: card["id"] for name, card in card_catalog.refresh().by_name.items()}
+    report = {"files": 0, "decks": 0, "cards": 0, "merged": 0, "skipped": 0, "skipped_cards": {}, "empty_decks": [], "unreadable": [], "duplicates": {}, "corrected": {}, "renamed": {}}
+    write_decks(parse_deck_files(file_names, card_ids_by_name, workers), report, batch_size, fuzzy_threshold)
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+def print_import_report(report: dict) -> None:
+    seconds = max(report["seconds"], 1e-9)
+    print(f"Files read: {report['files']}")
+    print(f"Decks imported: {report['decks']}")
+    print(f"Cards imported: {report['cards']}")
+    print(f"Duplicate card lines merged: {report['merged']}")
+    for card_name, matched_name in sorted(report["corrected"].items()):
+        print(f"'{card_name}' not found, imported as '{matched_name}'")
+    print(f"Cards skipped (not found): {report['skipped']}")
+    for card_name, count in sorted(report["skipped_cards"].items(), key=lambda item: -item[1]):
+        print(f"\t{count}x '{card_name}'")
+    for file_name in report["unreadable"]:
+        print(f"Couldn't read '{file_name}', skipped")
+    for file_name in report["empty_decks"]:
+        print(f"No known cards in '{file_name}', skipped")
+    for file_name, deck_name in report["renamed"].items():
+        print(f"'{file_name}' has the same deck name as another file, imported as '{deck_name}'")
+    for file_name, deck_id in report["duplicates"].items():
+        print(f"'{file_name}' has the same cards as deck {deck_id}, skipped")
+    print(f"Took {seconds:.2f}s ({report['files']/seconds:.1f} files/s, {report['cards']/seconds:.1f} cards/s)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import every untap deck file in a folder or glob pattern")
+    parser.add_argument("path", help="folder or glob pattern with the .txt deck files")
+    parser.add_argument("--workers", type=int, default=None, help="number of parser processes")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="decks written per transaction")
+    parser.add_argument("--fuzzy-threshold", type=float, default=AUTO_ACCEPT_SIMILARITY,
+                        help="import unknown card names as the most similar card at least this similar (0 to 1)")
+    parser.add_argument("--exact", action="store_true", help="only import cards whose name matches exactly")
+    args = parser.parse_args()
+    print_import_report(import_decks(args.path, args.workers, args.batch_size, None if args.exact else args.fuzzy_threshold))
@@ -0,0 +1,181 @@
+import marshal
+import os
+import threading
+
+import database
+from database import get_connection
+
+CARD_TYPES = ["creature", "event", "permanent"]
+REGIONS = ["dungeon", "graveyard", "academy", "fishing hamlet", "church", "town", "forest"]
+MADNESS_VALUES = list(range(6))
+# position of each value in the lists above, used to index fixed size counter arrays
+TYPE_INDEX = {card_type: i for i, card_type in enumerate(CARD_TYPES)}
+REGION_INDEX = {region: i for i, region in enumerate(REGIONS)}
+
+CATALOG_COLUMNS = ("id", "name", "type", "region", "effect", "madness", "rarity", "power")
+CATALOG_QUERY = f'SELECT {", ".join(CATALOG_COLUMNS)} FROM cards ORDER BY id'
+
+# The snapshot is a marshal file next to the database, set SANITYS_END_CATALOG_SNAPSHOT=0 to disable it
+SNAPSHOT_ENV_VAR = "SANITYS_END_CATALOG_SNAPSHOT"
+SNAPSHOT_SUFFIX = ".catalog"
+SNAPSHOT_FORMAT = 2
+
+def normalize_card_name(name: str) -> str:
+    return name.strip().casefold()
+
+# Lookup dicts of one load of the catalog, replaced as a whole so readers never mix two loads
+class CatalogIndexes:
+    __slots__ = ("generation", "by_id", "by_name", "by_region", "by_type", "by_madness")
+
+    def __init__(self, generation: int, cards: list[dict]):
+        self.generation = generation
+        self.by_id: dict[int, dict] = {}
+        self.by_name: dict[str, dict] = {}
+        self.by_region: dict[str, list[dict]] = {region: [] for region in REGIONS}
+        self.by_type: dict[str, list[dict]] = {card_type: [] for card_type in CARD_TYPES}
+        self.by_madness: dict[int, list[dict]] = {madness: [] for madness in MADNESS_VALUES}
+        for card in cards:
+            self.by_id[card["id"]] = card
+            self.by_name.setdefault(normalize_card_name(card["name"]), card)
+            self.by_region.setdefault(card["region"], []).append(card)
+            self.by_type.setdefault(card["type"], []).append(card)
+            self.by_madness.setdefault(card["madness"], []).append(card)
+
+# In-memory copy of the cards table, loaded once and reloaded only when the table changes.
+# Cards are plain dicts with the same keys as the cards table columns.
+# The deck server reads it from several threads: loads are serialized and published with a single assignment
+class CardCatalog:
+    def __init__(self):
+        self._database = None
+        self._version = None
+        self._lock = threading.Lock()
+        # a deck server client (see deckServer.py) to load the cards from instead of the database
+        self.client = None
+        self._indexes = CatalogIndexes(0, [])
+
+    # incremented on every load, so derived structures know when to rebuild
+    @property
+    def generation(self) -> int:
+        return self._indexes.generation
+
+    @property
+    def by_id(self) -> dict[int, dict]:
+        return self._indexes.by_id
+
+    @property
+    def by_name(self) -> dict[str, dict]:
+        return self._indexes.by_name
+
+    @property
+    def by_region(self) -> dict[str, list[dict]]:
+        return self._indexes.by_region
+
+    @property
+    def by_type(self) -> dict[str, list[dict]]:
+        return self._indexes.by_type
+
+    @property
+    def by_madness(self) -> dict[int, list[dict]]:
+        return self._indexes.by_madness
+
+    # catalog_version is bumped by triggers on every write to cards (from any connection or process),
+    # so a single row read is enough to know if the cached cards are still valid
+    def current_version(self) -> int:
+        if self.client is not None:
+            return self.client.call("catalog_version")
+        return get_connection().execute("SELECT version FROM catalog_version").fetchone()[0]
+
+    def use_client(self, client) -> None:
+        with self._lock:
+            self.client = client
+            self._database = None
+
+    # The catalog is shared by every connection to the same database (the server readers use several),
+    # and reloaded when the shared connection was closed since, as the database file may have changed
+    def refresh(self) -> "CardCatalog":
+        with self._lock:
+            if self.client is not None:
+                return self._refresh_from_client()
+            conn = get_connection()
+            version = self.current_version()
+            if (database.DB_FILE_NAME, database.connections_closed) == self._database and version == self._version:
+                return self
+            rows = read_snapshot(database.DB_FILE_NAME, version)
+            if rows is None:
+                rows = [tuple(row) for row in conn.execute(CATALOG_QUERY)]
+                write_snapshot(database.DB_FILE_NAME, version, rows)
+            self.load([dict(zip(CATALOG_COLUMNS, row)) for row in rows])
+            self._database = (database.DB_FILE_NAME, database.connections_closed)
+            self._version = version
+            return self
+
+    def _refresh_from_client(self) -> "CardCatalog":
+        if self._database == self.client and self.current_version() == self._version:
+            return self
+        catalog = self.client.call("catalog")
+        self.load([dict(zip(catalog["columns"], row)) for row in catalog["rows"]])
+        self._database = self.client
+        self._version = catalog["version"]
+        return self
+
+    def load(self, cards: list[dict]) -> None:
+        self._indexes = CatalogIndexes(self._indexes.generation + 1, cards)
+
+    # Lookups are plain dict reads of what the last refresh() loaded (the first lookup loads the cards if nothing did),
+    # operations that use the catalog call refresh() once when they start, so an untap import over --connect
+    # asks the server for the catalog version once instead of once per card line
+    def _loaded(self) -> CatalogIndexes:
+        indexes = self._indexes
+        return indexes if indexes.generation else self.refresh()._indexes
+
+    def find_by_name(self, name: str) -> dict | None:
+        return self._loaded().by_name.get(normalize_card_name(name))
+
+    def get(self, card_id: int) -> dict | None:
+        return self._loaded().by_id.get(card_id)
+
+    def cards_in_region(self, region: str) -> list[dict]:
+        return self._loaded().by_region.get(region, [])
+
+    def cards_of_type(self, card_type: str) -> list[dict]:
+        return self._loaded().by_type.get(card_type, [])
+
+    def cards_with_madness(self, madness: int) -> list[dict]:
+        return self._loaded().by_madness.get(madness, [])
+
+    def all_cards(self) -> list[dict]:
+        return list(self._loaded().by_id.values())
+
+def snapshot_enabled() -> bool:
+    return os.environ.get(SNAPSHOT_ENV_VAR, "1") != "0"
+
+def snapshot_file_name(db_file_name: str) -> str:
+    return db_file_name + SNAPSHOT_SUFFIX
+
+# Returns the catalog rows stored in the snapshot, or None if there is no valid snapshot for this database and version.
+# Only the catalog version is checked, so writing decks or match results keeps the snapshot valid
+def read_snapshot(db_file_name: str, version: int) -> list[tuple] | None:
+    if not snapshot_enabled():
+        return None
+    try:
+        with open(snapshot_file_name(db_file_name), "rb") as file:
+            snapshot_format, snapshot_version, columns, rows = marshal.load(file)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if (snapshot_format, snapshot_version, columns) != (SNAPSHOT_FORMAT, version, CATALOG_COLUMNS):
+        return None
+    return rows
+
+def write_snapshot(db_file_name: str, version: int, rows: list[tuple]) -> None:
+    if not snapshot_enabled():
+        return
+    file_name = snapshot_file_name(db_file_name)
+    try:
+        # written to a temporary file first so another process never reads half a snapshot
+        with open(file_name + ".tmp", "wb") as file:
+            marshal.dump((SNAPSHOT_FORMAT, version, CATALOG_COLUMNS, rows), file)
+        os.replace(file_name + ".tmp", file_name)
+    except OSError:
+        pass
+
+card_catalog = CardCatalog()
@@ -0,0 +1,83 @@
+import heapq
+import re
+import unicodedata
+from collections import Counter
+from itertools import chain
+
+from cardCatalog import card_catalog
+
+DEFAULT_SUGGESTIONS = 5
+# lowest similarity shown as a suggestion
+MIN_SIMILARITY = 0.25
+# a misspelled name is replaced by the most similar card when it is at least this similar, and at least
+# AMBIGUITY_MARGIN more similar than the next card (one typo in a 9 letter name gives about 0.58)
+AUTO_ACCEPT_SIMILARITY = 0.5
+AMBIGUITY_MARGIN = 0.1
+
+APOSTROPHES = str.maketrans({"‘": "'", "’": "'", "ʼ": "'", "`": "'", "´": "'"})
+SEPARATORS = re.compile(r"[\s\-_]+")
+
+# Lowercase, without accents, with a single kind of apostrophe and single spaces
+def fold_card_name(name: str) -> str:
+    name = unicodedata.normalize("NFKD", name.translate(APOSTROPHES))
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    return SEPARATORS.sub(" ", name).strip().casefold()
+
+# Trigrams of every word padded like "  word ", so short words and word starts weigh more
+def trigrams(folded_name: str) -> set[str]:
+    grams = set()
+    for word in folded_name.split(" "):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+# Inverted index from trigram to the cards that contain it. A lookup only touches the cards that share
+# at least one trigram with the name, and the similarity is the Jaccard index of the two trigram sets
+class CardNameIndex:
+    def __init__(self, cards: list[dict]):
+        self.cards = []
+        self.sizes = []
+        self.by_folded_name: dict[str, int] = {}
+        self.postings: dict[str, list[int]] = {}
+        for card in cards:
+            folded = fold_card_name(card["name"])
+            if folded in self.by_folded_name:
+                continue
+            row = len(self.cards)
+            self.by_folded_name[folded] = row
+            self.cards.append(card)
+            grams = trigrams(folded)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(row)
+
+    # Most similar cards first, as (card, similarity)
+    def suggest(self, name: str, limit: int = DEFAULT_SUGGESTIONS, min_similarity: float = MIN_SIMILARITY) -> list[tuple[dict, float]]:
+        grams = trigrams(fold_card_name(name))
+        shared = Counter(chain.from_iterable(self.postings.get(gram, ()) for gram in grams))
+        scored = ((count / (len(grams) + self.sizes[row] - count), row) for row, count in shared.items())
+        best = heapq.nlargest(limit, (item for item in scored if item[0] >= min_similarity))
+        return [(self.cards[row], similarity) for similarity, row in best]
+
+    # The card with this name (ignoring case, accents, apostrophe kinds and spacing), or else the most
+    # similar one if it is at least `threshold` similar and clearly more similar than any other card
+    def resolve(self, name: str, threshold: float = AUTO_ACCEPT_SIMILARITY) -> tuple[dict, float] | None:
+        row = self.by_folded_name.get(fold_card_name(name))
+        if row is not None:
+            return self.cards[row], 1.0
+        suggestions = self.suggest(name, 2, threshold - AMBIGUITY_MARGIN)
+        if not suggestions or suggestions[0][1] < threshold or (len(suggestions) > 1 and suggestions[0][1] - suggestions[1][1] < AMBIGUITY_MARGIN):
+            return None
+        return suggestions[0]
+
+_card_name_index: CardNameIndex | None = None
+_card_name_index_generation = None
+
+# Returns the index for the loaded catalog, rebuilding it only after the catalog reloads (callers refresh the catalog
+# when their operation starts, see CardCatalog)
+def get_card_name_index() -> CardNameIndex:
+    global _card_name_index, _card_name_index_generation
+    if _card_name_index is None or _card_name_index_generation != card_catalog.generation:
+        _card_name_index = CardNameIndex(card_catalog.all_cards())
+        _card_name_index_generation = card_catalog.generation
+    return _card_name_index
@@ -0,0 +1,108 @@
+from array import array
+from bisect import bisect_left, bisect_right
+
+from cardCatalog import card_catalog
+
+CARD_COLUMNS = ["id", "name", "type", "region", "effect", "power", "madness"]
+
+# Bitsets are plain python ints where bit i is set when the card in row i matches
+def bitset_rows(bits: int):
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
+
+# Sorted distinct values of an integer column, each with the bitset of the rows that have it and the
+# bitset of the rows with a smaller value, so '=', '<' and '>' are answered with one or two bitset operations
+class RangeIndex:
+    __slots__ = ("values", "equal", "below", "all_rows")
+
+    def __init__(self, column: list[int | None]):
+        rows_by_value: dict[int, int] = {}
+        for row, value in enumerate(column):
+            if value is not None:
+                rows_by_value[value] = rows_by_value.get(value, 0) | (1 << row)
+        self.values = sorted(rows_by_value)
+        self.equal = [rows_by_value[value] for value in self.values]
+        self.below = []
+        below = 0
+        for bits in self.equal:
+            self.below.append(below)
+            below |= bits
+        self.all_rows = below
+
+    def match(self, condition: str, value: int) -> int:
+        if condition == "=":
+            i = bisect_left(self.values, value)
+            return self.equal[i] if i < len(self.values) and self.values[i] == value else 0
+        if condition == "<":
+            i = bisect_left(self.values, value)
+            return self.below[i] if i < len(self.values) else self.all_rows
+        if condition == ">":
+            i = bisect_right(self.values, value)
+            return self.all_rows & ~self.below[i] if i < len(self.values) else 0
+        raise ValueError(f"Unknown condition '{condition}'")
+
+# Columnar copy of the card catalog used to answer the filter_cards params without touching SQLite
+class CardStore:
+    def __init__(self, cards: list[dict]):
+        self.cards = sorted(cards, key=lambda card: card["id"])
+        self.ids = array("q", (card["id"] for card in self.cards))
+        self.madness = array("b", (card["madness"] for card in self.cards))
+        self.names = [card["name"].lower() for card in self.cards]
+        self.effects = [card["effect"].lower() for card in self.cards]
+        self.all_rows = (1 << len(self.cards)) - 1
+        self.by_type: dict[str, int] = {}
+        self.by_region: dict[str, int] = {}
+        for row, card in enumerate(self.cards):
+            self.by_type[card["type"]] = self.by_type.get(card["type"], 0) | (1 << row)
+            self.by_region[card["region"]] = self.by_region.get(card["region"], 0) | (1 << row)
+        self.power_index = RangeIndex([card["power"] for card in self.cards])
+        self.madness_index = RangeIndex(list(self.madness))
+
+    def _text_rows(self, column: list[str], text: str) -> int:
+        text = text.strip().lower()
+        bits = 0
+        for row, value in enumerate(column):
+            if text in value:
+                bits |= 1 << row
+        return bits
+
+    # Compiles the filter params (same dict filter_cards builds) into bitset operations:
+    # values of the same list are OR'ed, and every filter is AND'ed with the others
+    def matching_rows(self, params: dict) -> int:
+        bits = self.all_rows
+        if params["type"] != []:
+            bits &= _union(self.by_type.get(card_type, 0) for card_type in params["type"])
+        if params["region"] != []:
+            bits &= _union(self.by_region.get(region, 0) for region in params["region"])
+        for condition in params["power"]:
+            bits &= self.power_index.match(condition["condition"], condition["value"])
+        for condition in params["madness"]:
+            bits &= self.madness_index.match(condition["condition"], condition["value"])
+        if bits and params["name"].strip() != "":
+            bits &= self._text_rows(self.names, params["name"])
+        if bits and params["effect"].strip() != "":
+            bits &= self._text_rows(self.effects, params["effect"])
+        return bits
+
+    def search(self, params: dict) -> list[dict]:
+        return [self.cards[row] for row in bitset_rows(self.matching_rows(params))]
+
+def _union(bitsets) -> int:
+    bits = 0
+    for bitset in bitsets:
+        bits |= bitset
+    return bits
+
+_card_store: CardStore | None = None
+_card_store_generation = None
+
+# Returns the store for the current catalog, rebuilding it only after the catalog reloads
+def get_card_store() -> CardStore:
+    global _card_store, _card_store_generation
+    card_catalog.refresh()
+    if _card_store is None or _card_store_generation != card_catalog.generation:
+        _card_store = CardStore(card_catalog.all_cards())
+        _card_store_generation = card_catalog.generation
+    return _card_store
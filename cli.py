@@ -0,0 +1,299 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from typing import Iterable
+
+# Only what every command needs is imported here, the modules of a single command (the menus of main, draw odds,
+# the auto-builder...) are imported by that command and their defaults filled in there, `python benchmark.py --startup` checks it
+import database
+import profiler
+import deckServer
+
+FILTER_CONDITIONS = ["=", ">", "<"]
+CARD_IN_DECK_COLUMNS = ["id", "quantity", "name", "type", "region", "effect", "power", "madness"]
+
+# Runs the deck and card operations, in this process or on the server given with --connect (see deckServer.py)
+client = deckServer.LocalClient()
+
+# Writes every row as soon as it is produced: one JSON object per line, or CSV with a header line
+def write_rows(columns: list[str], rows: Iterable, output_format: str, out=sys.stdout) -> int:
+    count = 0
+    if output_format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            out.write(json.dumps(dict(zip(columns, row))) + "\n")
+            count += 1
+    out.flush()
+    return count
+
+def write_object(obj: dict, output_format: str, out=sys.stdout) -> None:
+    if output_format == "csv":
+        write_rows(["key", "value"], ((key, value) for key, value in obj.items()), output_format, out)
+    else:
+        out.write(json.dumps(obj) + "\n")
+        out.flush()
+
+# Parses "--filter" values like "type=creature", "region=fishing hamlet", "power>2" or "effect=draw"
+# into the params dict used by the card filters
+def parse_card_filters(filters: list[str]) -> dict:
+    import main
+    params = main.empty_card_filter_params()
+    for card_filter in filters:
+        position = min((card_filter.find(condition) for condition in FILTER_CONDITIONS if condition in card_filter), default=-1)
+        if position <= 0:
+            raise argparse.ArgumentTypeError(f"Invalid filter '{card_filter}', expected <field><condition><value>")
+        field = card_filter[:position].strip()
+        condition = card_filter[position]
+        value = card_filter[position+1:].strip()
+        if field in ("name", "effect") and condition == "=":
+            params[field] = value
+        elif field in ("type", "region") and condition == "=":
+            params[field] = main.add_unique_to_array_as_copy(params[field], value)
+        elif field in ("power", "madness"):
+            params[field].append({"condition": condition, "value": int(value)})
+        else:
+            raise argparse.ArgumentTypeError(f"Invalid filter '{card_filter}'")
+    return params
+
+def get_deck_id_or_fail(deck: str) -> int:
+    deck_id = client.call("resolve_deck", deck=deck)
+    if deck_id is None:
+        raise SystemExit(f"Deck '{deck}' not found")
+    return deck_id
+
+def import_command(args) -> int:
+    for path in args.paths:
+        report = client.call("import", path=os.path.abspath(path), workers=args.workers, batch_size=args.batch_size,
+                             fuzzy_threshold=args.fuzzy_threshold, exact=args.exact)
+        write_object({"path": path, **report}, args.format)
+    return 0
+
+def export_command(args) -> int:
+    deck_id = get_deck_id_or_fail(args.deck)
+    text = client.call("deck_code", deck_id=deck_id) + "\n" if args.code else client.call("export", deck_id=deck_id)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text)
+    else:
+        sys.stdout.write(text)
+    return 0
+
+def export_library_command(args) -> int:
+    report = client.call("export_library", output=os.path.abspath(args.output), export_format=args.as_format,
+                         compress=True if args.gzip else None)
+    write_object(report, args.format)
+    return 0
+
+def import_code_command(args) -> int:
+    result = client.call("import_code", name=args.name, code=args.code)
+    write_object({"name": args.name, **result}, args.format)
+    return 0
+
+def list_cards_command(args) -> int:
+    table = client.call("list_cards", params=parse_card_filters(args.filter))
+    write_rows(table["columns"], table["rows"], args.format)
+    return 0
+
+def decks_command(args) -> int:
+    table = client.call("decks")
+    write_rows(table["columns"], table["rows"], args.format)
+    return 0
+
+def deck_command(args) -> int:
+    deck_id = get_deck_id_or_fail(args.deck)
+    if args.action == "show":
+        table = client.call("deck_cards", deck_id=deck_id)
+        write_rows(table["columns"], table["rows"], args.format)
+    elif args.action == "stats":
+        analysis = client.call("deck_stats", deck_id=deck_id)
+        write_object({"id": deck_id, **analysis["stats"], "regions": ",".join(analysis["regions"])}, args.format)
+    elif args.action in ("win", "loss"):
+        client.call("register_result", deck_id=deck_id, result=args.action, opponent=args.opponent)
+        write_object({"id": deck_id, "result": args.action, "opponent": args.opponent}, args.format)
+    elif args.action == "matchups":
+        table = client.call("matchups", deck_id=deck_id)
+        write_rows(table["columns"], table["rows"], args.format)
+    return 0
+
+# Chance of having drawn the required cards by each turn, for the given decks or the whole library
+def odds_command(args) -> int:
+    import drawOdds
+    turns = args.turns or drawOdds.DEFAULT_TURNS
+    conditions = [drawOdds.parse_condition(condition) for condition in args.require]
+    deck_ids = [get_deck_id_or_fail(deck) for deck in args.decks] if args.decks else None
+    columns = ["id", "name", "cards", "method", "conditions"] + [f"turn_{turn}" for turn in range(1, turns + 1)]
+    described = ",".join(drawOdds.describe_condition(condition) for condition in conditions)
+    table = client.call("deck_compositions", deck_ids=deck_ids)
+    compositions = ((deck_id, name, [tuple(card) for card in cards]) for deck_id, name, cards in table["rows"])
+    results = drawOdds.analyze_decks(compositions, conditions, turns, args.samples or drawOdds.DEFAULT_SAMPLES, args.seed, args.workers)
+    write_rows(columns, ([result["id"], result["name"], result["cards"], result["method"], described, *result["probabilities"]]
+                         for result in results), args.format)
+    return 0
+
+def similar_command(args) -> int:
+    deck_id = get_deck_id_or_fail(args.deck)
+    try:
+        table = client.call("similar_decks", deck_id=deck_id, top=args.top, metric=args.metric)
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    write_rows(table["columns"], table["rows"], args.format)
+    return 0
+
+# Builds candidate decks from the constraints and prints one row per card (rank 1 is the best candidate).
+# The search runs here, with --connect only the card catalog comes from the server
+def build_command(args) -> int:
+    import autoBuilder
+    from cardCatalog import card_catalog
+    card_catalog.refresh()
+    constraints = {
+        "size": args.size or autoBuilder.DEFAULT_DECK_SIZE,
+        "regions": autoBuilder.parse_regions(",".join(args.region)),
+        "madness_curve": autoBuilder.parse_madness_curve(args.madness_curve) if args.madness_curve else None,
+        "type_ratios": autoBuilder.parse_type_ratios(args.type_ratios) if args.type_ratios else None,
+        "must_include": dict(autoBuilder.parse_card_quantity(card) for card in args.include),
+    }
+    candidates = autoBuilder.build_decks(constraints, args.name, args.candidates or autoBuilder.DEFAULT_CANDIDATES,
+                                         args.budget or autoBuilder.DEFAULT_TIME_BUDGET, args.workers, args.seed)
+    if args.save and candidates:
+        candidates[0][1].id = client.call("save_deck", name=args.name, cards=candidates[0][1].card_quantities())
+    rows = ((rank, score, deck.id, card["id"], card["name"], quantity)
+            for rank, (score, deck) in enumerate(candidates, 1) for card, quantity in deck.entries())
+    write_rows(["rank", "score", "deck_id", "card_id", "name", "quantity"], rows, args.format)
+    return 0
+
+def menu_command(args) -> int:
+    import main
+    main.create_main_menu()
+    return 0
+
+def serve_command(args) -> int:
+    import asyncio
+    address = f"unix:{args.socket}" if args.socket else str(args.port or deckServer.DEFAULT_PORT)
+    try:
+        asyncio.run(deckServer.serve(address, args.readers))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="main.py", description="Insight Apparatus batch commands (no menus, no prompts)")
+    parser.add_argument("--format", choices=["json", "csv"], default="json", help="output format (json is one object per line)")
+    parser.add_argument("--db", default=None, help="database file to use instead of cards.db")
+    parser.add_argument("--profile", action="store_true", help="print the slowest statements and actions on exit (to stderr)")
+    parser.add_argument("--connect", default=None, metavar="ADDRESS",
+                        help="send the commands to a running server (socket path, host:port or port) instead of opening the database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="import untap deck files, folders or glob patterns")
+    import_parser.add_argument("paths", nargs="+")
+    import_parser.add_argument("--workers", type=int, default=None)
+    import_parser.add_argument("--batch-size", type=int, default=200)
+    import_parser.add_argument("--fuzzy-threshold", type=float, default=None,
+                               help="import unknown card names as the most similar card at least this similar (0 to 1, 0.5 by default)")
+    import_parser.add_argument("--exact", action="store_true", help="only import cards whose name matches exactly")
+    import_parser.set_defaults(func=import_command)
+
+    export_parser = subparsers.add_parser("export", help="print a deck in untap format")
+    export_parser.add_argument("deck", help="deck id or name")
+    export_parser.add_argument("--output", "-o", default=None, help="file to write instead of stdout")
+    export_parser.add_argument("--code", action="store_true", help="print the deck code instead of the untap list")
+    export_parser.set_defaults(func=export_command)
+
+    library_parser = subparsers.add_parser("export-library", help="export every deck as untap files, JSON lines or CSV")
+    library_parser.add_argument("output", help="folder for untap files (a .tar.gz with --gzip), or a .jsonl or .csv file")
+    library_parser.add_argument("--as", dest="as_format", default=None,
+                                help="untap, jsonl or csv (guessed from the output name if not given, untap otherwise)")
+    library_parser.add_argument("--gzip", action="store_true", help="compress the output (also when the output name ends with .gz)")
+    library_parser.set_defaults(func=export_library_command)
+
+    import_code_parser = subparsers.add_parser("import-code", help="save the deck of a deck code (see export --code)")
+    import_code_parser.add_argument("code")
+    import_code_parser.add_argument("name", help="name of the new deck")
+    import_code_parser.set_defaults(func=import_code_command)
+
+    list_parser = subparsers.add_parser("list-cards", help="list the cards, optionally filtered")
+    list_parser.add_argument("--filter", action="append", default=[],
+                             help="e.g. type=creature, region=town, power>2, madness<3, name=shack, effect=draw (repeatable)")
+    list_parser.set_defaults(func=list_cards_command)
+
+    deck_parser = subparsers.add_parser("deck", help="show a deck, its stats or matchups, or register a result")
+    deck_parser.add_argument("action", choices=["show", "stats", "win", "loss", "matchups"])
+    deck_parser.add_argument("deck", help="deck id or name")
+    deck_parser.add_argument("--opponent", default="", help="opponent deck or region of a win or loss")
+    deck_parser.set_defaults(func=deck_command)
+
+    odds_parser = subparsers.add_parser("odds", help="chance of drawing the required cards by each turn")
+    odds_parser.add_argument("decks", nargs="*", help="deck ids or names (every deck if none)")
+    odds_parser.add_argument("--require", action="append", required=True,
+                             help="e.g. madness=2, region=town:2, type=creature:3 (at least 1 if no count, repeatable, all must hold)")
+    odds_parser.add_argument("--turns", type=int, default=None, help="turns to compute (5 by default)")
+    odds_parser.add_argument("--samples", type=int, default=None, help="shuffles simulated when there are several conditions (1000000 by default)")
+    odds_parser.add_argument("--seed", type=int, default=None)
+    odds_parser.add_argument("--workers", type=int, default=None)
+    odds_parser.set_defaults(func=odds_command)
+
+    similar_parser = subparsers.add_parser("similar", help="decks with the most cards in common with a deck")
+    similar_parser.add_argument("deck", help="deck id or name")
+    similar_parser.add_argument("--top", type=int, default=None, help="decks to list (10 by default)")
+    similar_parser.add_argument("--metric", default="cosine", help="cosine (weighs the quantities) or jaccard (only counts the distinct cards)")
+    similar_parser.set_defaults(func=similar_command)
+
+    build_parser_ = subparsers.add_parser("build", help="build candidate decks from constraints")
+    build_parser_.add_argument("name", help="name of the deck")
+    build_parser_.add_argument("--size", type=int, default=None, help="cards in the deck (40 by default)")
+    build_parser_.add_argument("--region", action="append", default=[], help="allowed region, each gets at least one card (repeatable)")
+    build_parser_.add_argument("--madness-curve", default=None, help="weight of every madness value, e.g. 4,8,10,8,6,4")
+    build_parser_.add_argument("--type-ratios", default=None, help="e.g. creature=0.6,event=0.2,permanent=0.2")
+    build_parser_.add_argument("--include", action="append", default=[], help="card that must be in the deck, e.g. 'Insight:2' (repeatable)")
+    build_parser_.add_argument("--candidates", type=int, default=None, help="candidates to print (3 by default)")
+    build_parser_.add_argument("--budget", type=float, default=None, help="seconds of search per worker (2 by default)")
+    build_parser_.add_argument("--workers", type=int, default=None)
+    build_parser_.add_argument("--seed", type=int, default=None)
+    build_parser_.add_argument("--save", action="store_true", help="save the best candidate")
+    build_parser_.set_defaults(func=build_command)
+
+    decks_parser = subparsers.add_parser("decks", help="list every deck")
+    decks_parser.set_defaults(func=decks_command)
+
+    menu_parser = subparsers.add_parser("menu", help="open the interactive menus (on the server given with --connect)")
+    menu_parser.set_defaults(func=menu_command)
+
+    serve_parser = subparsers.add_parser("serve", help="serve the database to several clients (see --connect)")
+    serve_address = serve_parser.add_mutually_exclusive_group()
+    serve_address.add_argument("--socket", default=None, help="Unix socket path to listen on")
+    serve_address.add_argument("--port", type=int, default=None, help=f"TCP port to listen on, on {deckServer.DEFAULT_HOST} (default {deckServer.DEFAULT_PORT})")
+    serve_parser.add_argument("--readers", type=int, default=deckServer.DEFAULT_READERS, help="read-only connections used in parallel")
+    serve_parser.set_defaults(func=serve_command)
+    return parser
+
+def run(argv: list[str] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.profile:
+        profiler.enable()
+        database.close_connection()
+    if args.db:
+        database.use_database(args.db)
+    if args.connect:
+        global client
+        import main
+        try:
+            client = main.connect(args.connect)
+        except OSError as e:
+            raise SystemExit(f"Could not connect to {args.connect}: {e}")
+    try:
+        return profiler.time_action(f"cli {args.command}", args.func, args)
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+    except deckServer.ServerError as e:
+        raise SystemExit(f"Server error: {e}")
+
+if __name__ == "__main__":
+    sys.exit(run())
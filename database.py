@@ -0,0 +1,99 @@
+import sqlite3
+import atexit
+import threading
+from contextlib import contextmanager
+
+import profiler
+from migrations import migrate
+
+DB_FILE_NAME = 'cards.db'
+
+# Settings applied once to the shared connection, every module goes through get_connection()
+CONNECTION_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,  # negative means KiB, so ~16MB of page cache
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+STATEMENT_CACHE_SIZE = 512
+
+# Pragmas for the read-only connections of the server readers (see deckServer.py)
+READER_PRAGMAS = {
+    "query_only": "ON",
+    "cache_size": -16000,
+    "temp_store": "MEMORY",
+}
+
+_connection: sqlite3.Connection | None = None
+# incremented every time the shared connection is closed, so caches know the database may have been swapped
+connections_closed = 0
+# connection bound to the current thread with using_connection(), used instead of the shared one
+_local = threading.local()
+
+def configure_connection(conn: sqlite3.Connection) -> sqlite3.Connection:
+    for pragma, value in CONNECTION_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def open_connection(db_file_name: str = None) -> sqlite3.Connection:
+    if profiler.enabled:
+        conn = sqlite3.connect(db_file_name or DB_FILE_NAME, cached_statements=STATEMENT_CACHE_SIZE, factory=profiler.ProfiledConnection)
+        profiler.install_hooks(conn)
+    else:
+        conn = sqlite3.connect(db_file_name or DB_FILE_NAME, cached_statements=STATEMENT_CACHE_SIZE)
+    return configure_connection(conn)
+
+# Returns the long-lived connection, opening it (and bringing the schema up to date) on first use.
+# Use it as `with get_connection() as conn:` to get a transaction that commits on success and rolls back on errors,
+# the connection itself stays open until close_connection() is called
+def get_connection() -> sqlite3.Connection:
+    global _connection
+    if getattr(_local, "connection", None) is not None:
+        return _local.connection
+    if _connection is None:
+        _connection = open_connection()
+        migrate(_connection)
+    return _connection
+
+# Read-only connection that can be used from any thread, the schema must already be migrated
+def open_read_only_connection(db_file_name: str = None) -> sqlite3.Connection:
+    factory = profiler.ProfiledConnection if profiler.enabled else sqlite3.Connection
+    conn = sqlite3.connect(f"file:{db_file_name or DB_FILE_NAME}?mode=ro", uri=True, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE, factory=factory)
+    if profiler.enabled:
+        profiler.install_hooks(conn)
+    for pragma, value in READER_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+# Makes get_connection() return conn in the current thread until the block ends
+@contextmanager
+def using_connection(conn: sqlite3.Connection, read_only: bool = True):
+    _local.connection = conn
+    _local.read_only = read_only
+    try:
+        yield conn
+    finally:
+        _local.connection = None
+        _local.read_only = False
+
+def is_read_only() -> bool:
+    return getattr(_local, "read_only", False)
+
+def close_connection() -> None:
+    global _connection, connections_closed
+    if _connection is not None:
+        _connection.close()
+        _connection = None
+        connections_closed += 1
+
+# Points the shared connection to another database file (closing the current one)
+def use_database(db_file_name: str) -> None:
+    global DB_FILE_NAME
+    close_connection()
+    DB_FILE_NAME = db_file_name
+
+atexit.register(close_connection)
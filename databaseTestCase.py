@@ -0,0 +1,19 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import database
+
+# Runs every test against a copy of cards.db, so the shipped database is never written to
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.db_file_name = os.path.join(self.folder, "cards.db")
+        shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), "cards.db"), self.db_file_name)
+        self.previous_db_file_name = database.DB_FILE_NAME
+        database.use_database(self.db_file_name)
+
+    def tearDown(self):
+        database.use_database(self.previous_db_file_name)
+        shutil.rmtree(self.folder)
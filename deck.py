@@ -0,0 +1,80 @@
+from cardCatalog import card_catalog, CARD_TYPES, REGIONS, MADNESS_VALUES, TYPE_INDEX, REGION_INDEX
+
+MAX_COPIES = 2
+
+# In-memory deck being built or edited. Cards are kept by id and the region, type and madness
+# counters live in fixed size lists indexed like the catalog lists, so every edit is O(1)
+class Deck:
+    __slots__ = ("id", "name", "cards", "quantities", "total", "region_counts", "type_counts", "madness_counts")
+
+    def __init__(self, name: str, deck_id: int = None):
+        self.id = deck_id
+        self.name = name
+        self.cards: dict[int, dict] = {}
+        self.quantities: dict[int, int] = {}
+        self.total = 0
+        self.region_counts = [0] * len(REGIONS)
+        self.type_counts = [0] * len(CARD_TYPES)
+        self.madness_counts = [0] * len(MADNESS_VALUES)
+
+    @classmethod
+    def from_card_quantities(cls, name: str, card_quantities: dict[int, int], deck_id: int = None) -> "Deck":
+        deck = cls(name, deck_id)
+        for card_id, quantity in card_quantities.items():
+            card = card_catalog.get(card_id)
+            if card is not None:
+                deck.set_quantity(card, quantity)
+        return deck
+
+    def _count(self, card: dict, quantity: int) -> None:
+        self.total += quantity
+        self.region_counts[REGION_INDEX[card["region"]]] += quantity
+        self.type_counts[TYPE_INDEX[card["type"]]] += quantity
+        self.madness_counts[card["madness"]] += quantity
+
+    def quantity_of(self, card_id: int) -> int:
+        return self.quantities.get(card_id, 0)
+
+    # Sets the copies of a card (capped at max_copies) and returns the difference to the previous quantity
+    def set_quantity(self, card: dict, quantity: int, max_copies: int = MAX_COPIES) -> int:
+        card_id = card["id"]
+        quantity = max(0, min(quantity, max_copies))
+        difference = quantity - self.quantities.get(card_id, 0)
+        if difference == 0:
+            return 0
+        self._count(card, difference)
+        if quantity == 0:
+            del self.quantities[card_id]
+            del self.cards[card_id]
+        else:
+            self.quantities[card_id] = quantity
+            self.cards[card_id] = card
+        return difference
+
+    # Returns how many copies were actually added
+    def add(self, card: dict, quantity: int, max_copies: int = MAX_COPIES) -> int:
+        return self.set_quantity(card, self.quantity_of(card["id"]) + quantity, max_copies)
+
+    # Returns how many copies were actually removed
+    def remove(self, card: dict, quantity: int) -> int:
+        return -self.set_quantity(card, self.quantity_of(card["id"]) - quantity)
+
+    def entries(self) -> list[tuple[dict, int]]:
+        return [(self.cards[card_id], quantity) for card_id, quantity in self.quantities.items()]
+
+    def card_quantities(self) -> dict[int, int]:
+        return dict(self.quantities)
+
+    def regions(self) -> list[tuple[str, int]]:
+        return [(region, count) for region, count in zip(REGIONS, self.region_counts) if count != 0]
+
+    def types(self) -> list[tuple[str, int]]:
+        return list(zip(CARD_TYPES, self.type_counts))
+
+    # Same shape as repository.get_deck_analysis_by_id
+    def analysis(self) -> dict:
+        stats = {"name": self.name, "total": self.total}
+        stats.update(zip(CARD_TYPES, self.type_counts))
+        stats.update((f"mad_{madness}", count) for madness, count in zip(MADNESS_VALUES, self.madness_counts))
+        stats.update(self.regions())
+        return {"stats": stats, "regions": [region for region, _ in self.regions()]}
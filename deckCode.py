@@ -0,0 +1,78 @@
+# base64 and hashlib are imported when used, hashlib loads OpenSSL which slows down the startup
+
+# First byte of every code, bumped if the layout ever changes (and hashes of the old layout stay valid)
+CODE_VERSION = 1
+HASH_BYTES = 16
+
+# Unsigned LEB128: 7 bits per byte, the high bit set on every byte but the last
+def write_varint(value: int, out: bytearray) -> None:
+    # card id gaps and quantities almost always fit in one byte
+    if 0 <= value < 0x80:
+        out.append(value)
+        return
+    if value < 0:
+        raise ValueError(f"Cannot encode negative value {value}")
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data: bytes, position: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        if position >= len(data):
+            raise ValueError("Truncated deck code")
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+# Canonical bytes of a deck: the cards sorted by id, as (id - previous id, quantity) varint pairs.
+# Decks with the same cards give the same bytes whatever the order they were added in
+def encode_cards(card_quantities: dict[int, int]) -> bytes:
+    out = bytearray()
+    previous = 0
+    for card_id in sorted(card_id for card_id, quantity in card_quantities.items() if quantity > 0):
+        write_varint(card_id - previous, out)
+        write_varint(card_quantities[card_id], out)
+        previous = card_id
+    return bytes(out)
+
+def decode_cards(data: bytes) -> dict[int, int]:
+    card_quantities = {}
+    card_id = 0
+    position = 0
+    while position < len(data):
+        delta, position = read_varint(data, position)
+        quantity, position = read_varint(data, position)
+        card_id += delta
+        if quantity == 0 or (card_quantities and delta == 0):
+            raise ValueError("Invalid deck code")
+        card_quantities[card_id] = quantity
+    return card_quantities
+
+# Short text form of a deck (around 3 characters per card) that only holds card ids, so it can be
+# shared and decoded without the card names
+def encode_deck_code(card_quantities: dict[int, int]) -> str:
+    import base64
+    data = bytes([CODE_VERSION]) + encode_cards(card_quantities)
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def decode_deck_code(code: str) -> dict[int, int]:
+    import base64
+    code = code.strip()
+    try:
+        data = base64.urlsafe_b64decode(code + "=" * (-len(code) % 4))
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid deck code '{code}'")
+    if not data or data[0] != CODE_VERSION:
+        raise ValueError(f"Invalid deck code '{code}' (unknown version)")
+    return decode_cards(data[1:])
+
+# Stored in decks.content_hash, equal for decks with the same cards and quantities
+def content_hash(card_quantities: dict[int, int]) -> str:
+    import hashlib
+    return hashlib.blake2b(encode_cards(card_quantities), digest_size=HASH_BYTES).hexdigest()
@@ -0,0 +1,341 @@
+# Every scripted command goes through a client of this module, so what only the server (sockets, threads, signals)
+# or a single operation needs is imported where it is used
+import io
+import json
+import os
+import sys
+
+import database
+import repository
+from cardCatalog import card_catalog, CATALOG_COLUMNS
+from deckCode import decode_deck_code
+from matchLog import match_log
+from migrations import migrate
+
+DEFAULT_READERS = 4
+DEFAULT_PORT = 8765
+DEFAULT_HOST = "127.0.0.1"
+# writes waiting in the queue are taken together, and the match log is flushed once per batch
+MAX_WRITE_BATCH = 64
+
+# Repository operations served to the clients. Every operation takes JSON parameters and returns something
+# JSON can encode, tables as {"columns": [...], "rows": iterable} so local callers can stream the rows
+def _table(cursor_or_rows, columns: list[str] = None) -> dict:
+    if columns is None:
+        columns = [column[0] for column in cursor_or_rows.description]
+    return {"columns": columns, "rows": (tuple(row) for row in cursor_or_rows)}
+
+# The version is read before the cards, so a client never keeps cards older than the version it stores
+def op_catalog() -> dict:
+    version = card_catalog.current_version()
+    return {"version": version, "columns": list(CATALOG_COLUMNS),
+            "rows": [tuple(card[column] for column in CATALOG_COLUMNS) for card in card_catalog.refresh().all_cards()]}
+
+def op_catalog_version() -> int:
+    return card_catalog.current_version()
+
+def op_resolve_deck(deck: str | int) -> int | None:
+    return repository.resolve_deck_id(deck)
+
+def op_decks() -> dict:
+    return _table(repository.iter_all_decks())
+
+def op_deck_cards(deck_id: int) -> dict:
+    return _table(repository.get_connection().execute(repository.CARDS_FROM_DECK_QUERY, (deck_id,)))
+
+def op_deck_stats(deck_id: int) -> dict | None:
+    return repository.get_deck_analysis_by_id(deck_id)
+
+def op_matchups(deck_id: int) -> dict:
+    return _table(repository.get_matchups_for_deck_id(deck_id), ["opponent", "wins", "games", "win_rate"])
+
+# Rows of (deck id, deck name, [(type, region, madness, quantity)]) for drawOdds.analyze_decks
+def op_deck_compositions(deck_ids: list[int] = None) -> dict:
+    from drawOdds import iter_deck_compositions
+    return _table(iter_deck_compositions(deck_ids), ["id", "name", "cards"])
+
+def op_identical_deck(cards: dict) -> int | None:
+    return repository.find_identical_deck_id({int(card_id): quantity for card_id, quantity in cards.items()})
+
+def op_list_cards(params: dict) -> dict:
+    columns, rows = repository.search_cards(params)
+    return _table(rows, columns)
+
+def op_export(deck_id: int) -> str:
+    from deck import Deck
+    from libraryExport import write_untap_deck
+    analysis = repository.get_deck_analysis_by_id(deck_id)
+    quantities = {card["id"]: card["quantity"] for card in repository.get_cards_for_deck_id(deck_id)}
+    out = io.StringIO()
+    card_catalog.refresh()
+    write_untap_deck(Deck.from_card_quantities(analysis["stats"]["name"], quantities, deck_id), out)
+    return out.getvalue()
+
+def op_deck_code(deck_id: int) -> str:
+    return repository.get_deck_code(deck_id)
+
+def op_export_library(output: str, export_format: str = None, compress: bool = None) -> dict:
+    from libraryExport import export_library
+    return export_library(output, export_format, compress)
+
+def op_save_deck(name: str, cards: dict) -> int:
+    return repository.save_deck(name, {int(card_id): quantity for card_id, quantity in cards.items()})
+
+def op_delete_deck(deck_id: int) -> None:
+    repository.delete_deck_by_id(deck_id)
+
+def op_register_result(deck_id: int, result: str, opponent: str = "") -> None:
+    match_log.record(deck_id, result, opponent)
+
+# Saves the deck of a code unless a deck with the same cards is already stored. Like the menu import, cards that
+# are not in the catalog are left out and copies are capped, a code without any known card is rejected
+def op_import_code(name: str, code: str) -> dict:
+    from deck import Deck
+    card_quantities = decode_deck_code(code)
+    if not card_quantities:
+        raise ValueError(f"Deck code '{code}' has no cards")
+    card_catalog.refresh()
+    deck = Deck.from_card_quantities(name, card_quantities)
+    if not deck.quantities:
+        raise ValueError(f"None of the cards of deck code '{code}' are in the catalog")
+    unknown_cards = len(card_quantities) - len(deck.quantities)
+    identical_deck_id = repository.find_identical_deck_id(deck.card_quantities())
+    if identical_deck_id is not None:
+        return {"id": identical_deck_id, "imported": False, "unknown_cards": unknown_cards}
+    return {"id": repository.save_deck(name, deck.card_quantities()), "imported": True, "unknown_cards": unknown_cards}
+
+def op_similar_decks(deck_id: int, top: int = None, metric: str = "cosine") -> dict:
+    from deckSimilarity import deck_index, DEFAULT_TOP
+    similar = deck_index.similar_to_deck(deck_id, top or DEFAULT_TOP, metric)
+    analyses = repository.get_deck_analyses_by_ids([similar_id for similar_id, _ in similar])
+    return _table(((similar_id, analyses[similar_id]["stats"]["name"], similarity) for similar_id, similarity in similar),
+                  ["id", "name", "similarity"])
+
+# Stored decks almost the same as these cards, leaving out the deck with this name (the one a save overwrites).
+# Empty without numpy, since it is only used for warnings
+def op_near_duplicates(name: str, cards: dict) -> list[tuple[int, float]]:
+    from deckSimilarity import deck_index, numpy_available, NEAR_DUPLICATE_SIMILARITY
+    if not numpy_available():
+        return []
+    deck_id = repository.find_deck_id(database.get_connection(), name)
+    similar = deck_index.similar({int(card_id): quantity for card_id, quantity in cards.items()}, k=3,
+                                 exclude={deck_id} if deck_id is not None else set())
+    return [(similar_id, similarity) for similar_id, similarity in similar if similarity >= NEAR_DUPLICATE_SIMILARITY]
+
+# fuzzy_threshold defaults to cardNameIndex.AUTO_ACCEPT_SIMILARITY, exact turns the fuzzy matching off
+def op_import(path: str, workers: int = None, batch_size: int = None, fuzzy_threshold: float = None, exact: bool = False) -> dict:
+    from bulkImport import import_decks, DEFAULT_BATCH_SIZE
+    from cardNameIndex import AUTO_ACCEPT_SIMILARITY
+    fuzzy_threshold = None if exact else fuzzy_threshold if fuzzy_threshold is not None else AUTO_ACCEPT_SIMILARITY
+    return import_decks(path, workers, batch_size or DEFAULT_BATCH_SIZE, fuzzy_threshold)
+
+READ_OPERATIONS = {
+    "catalog": op_catalog,
+    "catalog_version": op_catalog_version,
+    "resolve_deck": op_resolve_deck,
+    "decks": op_decks,
+    "deck_cards": op_deck_cards,
+    "deck_stats": op_deck_stats,
+    "matchups": op_matchups,
+    "deck_compositions": op_deck_compositions,
+    "identical_deck": op_identical_deck,
+    "list_cards": op_list_cards,
+    "export": op_export,
+    "deck_code": op_deck_code,
+    "export_library": op_export_library,
+}
+# The similar deck searches run with the writes, on the writer thread: the deck index is not thread safe,
+# and it is kept up to date by the saves of the writer connection instead of being rebuilt
+WRITE_OPERATIONS = {
+    "save_deck": op_save_deck,
+    "delete_deck": op_delete_deck,
+    "register_result": op_register_result,
+    "import": op_import,
+    "import_code": op_import_code,
+    "similar_decks": op_similar_decks,
+    "near_duplicates": op_near_duplicates,
+}
+
+# Runs the operations in this process, on the shared connection
+class LocalClient:
+    def call(self, op: str, **params):
+        operation = READ_OPERATIONS.get(op) or WRITE_OPERATIONS.get(op)
+        if operation is None:
+            raise ValueError(f"Unknown operation '{op}'")
+        return operation(**params)
+
+class ServerError(Exception):
+    pass
+
+# "unix:/path/to/socket" or a path for a Unix socket, "host:port" or "port" for TCP on localhost
+def parse_address(address: str) -> tuple[str, str | tuple[str, int]]:
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    if "/" in address or address.endswith(".sock"):
+        return "unix", address
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or DEFAULT_HOST, int(port))
+
+# Sends the operations to a running server, one JSON line per request and per response
+class RemoteClient:
+    def __init__(self, address: str):
+        import socket
+        family, target = parse_address(address)
+        self.socket = socket.socket(socket.AF_UNIX if family == "unix" else socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.connect(target)
+        self.file = self.socket.makefile("rwb")
+        self.next_id = 0
+
+    def call(self, op: str, **params):
+        self.next_id += 1
+        self.file.write((json.dumps({"id": self.next_id, "op": op, "params": params}) + "\n").encode())
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ServerError("The server closed the connection")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise ServerError(response["error"])
+        return response["result"]
+
+    def close(self) -> None:
+        self.file.close()
+        self.socket.close()
+
+def _materialize(result):
+    if isinstance(result, dict) and "rows" in result:
+        return {**result, "rows": [list(row) for row in result["rows"]]}
+    return result
+
+# Owns the database: reads run in a thread pool, each on a read-only connection taken from a pool,
+# and every write goes through one queue consumed by a single writer task (and thread), so writers
+# never wait for each other's locks. WAL lets the readers run while the writer commits
+class DeckServer:
+    def __init__(self, readers: int = DEFAULT_READERS):
+        from concurrent.futures import ThreadPoolExecutor
+        self.readers = readers
+        self.read_executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="reader")
+        self.write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+
+    # Connections can only be used from the thread that opened them, so the writer one is opened in the writer thread
+    def _open_writer(self) -> None:
+        self.writer = database.open_connection()
+        migrate(self.writer)
+        with database.using_connection(self.writer, read_only=False):
+            card_catalog.refresh()
+
+    async def start(self) -> None:
+        import asyncio
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.write_executor, self._open_writer)
+        self.connections = asyncio.Queue()
+        for _ in range(self.readers):
+            self.connections.put_nowait(database.open_read_only_connection())
+        self.writes = asyncio.Queue()
+        self.writer_task = asyncio.create_task(self.write_loop())
+
+    def _read(self, conn, op: str, params: dict):
+        with database.using_connection(conn):
+            return _materialize(READ_OPERATIONS[op](**params))
+
+    def _write(self, batch: list[tuple]) -> list[tuple[bool, object]]:
+        results = []
+        with database.using_connection(self.writer, read_only=False):
+            for op, params, _ in batch:
+                try:
+                    results.append((True, _materialize(WRITE_OPERATIONS[op](**params))))
+                except Exception as e:
+                    results.append((False, e))
+            match_log.flush()
+        return results
+
+    def _close_writer(self) -> None:
+        with database.using_connection(self.writer, read_only=False):
+            match_log.flush()
+        self.writer.close()
+
+    async def close(self) -> None:
+        import asyncio
+        self.writer_task.cancel()
+        await asyncio.get_running_loop().run_in_executor(self.write_executor, self._close_writer)
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+        self.read_executor.shutdown()
+        self.write_executor.shutdown()
+
+    async def write_loop(self) -> None:
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.writes.get()]
+            while not self.writes.empty() and len(batch) < MAX_WRITE_BATCH:
+                batch.append(self.writes.get_nowait())
+            try:
+                results = await loop.run_in_executor(self.write_executor, self._write, batch)
+            except Exception as e:
+                results = [(False, e)] * len(batch)
+            for (_, _, future), (ok, value) in zip(batch, results):
+                if not future.done():
+                    future.set_result(value) if ok else future.set_exception(value)
+
+    async def dispatch(self, op: str, params: dict):
+        import asyncio
+        if op in READ_OPERATIONS:
+            conn = await self.connections.get()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.read_executor, self._read, conn, op, params)
+            finally:
+                self.connections.put_nowait(conn)
+        if op in WRITE_OPERATIONS:
+            future = asyncio.get_running_loop().create_future()
+            await self.writes.put((op, params, future))
+            return await future
+        raise ValueError(f"Unknown operation '{op}'")
+
+    async def handle_client(self, reader, writer) -> None:
+        try:
+            while line := await reader.readline():
+                request_id = None
+                try:
+                    request = json.loads(line)
+                    request_id = request.get("id")
+                    result = await self.dispatch(request["op"], request.get("params") or {})
+                    response = {"id": request_id, "ok": True, "result": result}
+                except Exception as e:
+                    response = {"id": request_id, "ok": False, "error": str(e) or type(e).__name__}
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+async def serve(address: str, readers: int = DEFAULT_READERS) -> None:
+    import asyncio
+    import signal
+    server = DeckServer(readers)
+    await server.start()
+    family, target = parse_address(address)
+    if family == "unix":
+        if os.path.exists(target):
+            os.remove(target)
+        listener = await asyncio.start_unix_server(server.handle_client, path=target)
+    else:
+        listener = await asyncio.start_server(server.handle_client, host=target[0], port=target[1])
+    # stops cleanly (flushing the match log) on Ctrl+C and on kill
+    main_task = asyncio.current_task()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal_number, main_task.cancel)
+        except (NotImplementedError, RuntimeError):
+            pass
+    print(f"Serving {database.DB_FILE_NAME} on {address} ({readers} readers, 1 writer)", file=sys.stderr)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await server.close()
+        if family == "unix" and os.path.exists(target):
+            os.remove(target)
@@ -0,0 +1,164 @@
+import database
+from database import get_connection
+
+METRICS = ["cosine", "jaccard"]
+DEFAULT_TOP = 10
+NEAR_DUPLICATE_SIMILARITY = 0.9
+# decks changed since the last build are kept apart (and compared one by one) until there are this many
+MAX_PENDING = 256
+FETCH_SIZE = 100_000
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Finding similar decks needs numpy (pip install numpy)")
+    return numpy
+
+def numpy_available() -> bool:
+    try:
+        _numpy()
+    except RuntimeError:
+        return False
+    return True
+
+# Every deck in deck_cards as a row of card quantities, in CSR form: the cards of row r are
+# indices[indptr[r]:indptr[r+1]] with quantities in data (rows holds the row of every entry, for bincount).
+# Saves and deletes from this process are applied incrementally: the old row is marked dead and the new
+# cards wait in pending until MAX_PENDING decks changed, then the arrays are compacted.
+# Writes from other connections change PRAGMA data_version, which triggers a full rebuild. data_version is
+# only comparable on the same connection, so the database file and the connections closed so far are part of the key
+class DeckIndex:
+    def __init__(self):
+        self.loaded = False
+        self._data_version = None
+
+    def invalidate(self) -> None:
+        self.loaded = False
+
+    def _ensure_loaded(self) -> "DeckIndex":
+        conn = get_connection()
+        data_version = (database.DB_FILE_NAME, database.connections_closed, conn.execute("PRAGMA data_version").fetchone()[0])
+        if not self.loaded or data_version != self._data_version:
+            self._build()
+            self._data_version = data_version
+        return self
+
+    def _build(self) -> None:
+        numpy = _numpy()
+        cursor = get_connection().cursor()
+        cursor.row_factory = None
+        cursor.execute("SELECT deck_id, card_id, quantity FROM deck_cards WHERE quantity > 0 ORDER BY deck_id, card_id")
+        chunks = []
+        while rows := cursor.fetchmany(FETCH_SIZE):
+            chunks.append(numpy.array(rows, dtype=numpy.int64))
+        entries = numpy.concatenate(chunks) if chunks else numpy.zeros((0, 3), dtype=numpy.int64)
+        self._set_entries(entries[:, 0], entries[:, 1], entries[:, 2])
+
+    # Builds the arrays from (deck id, card id, quantity) entries sorted by deck id
+    def _set_entries(self, deck_ids, card_ids, quantities) -> None:
+        numpy = _numpy()
+        starts = numpy.flatnonzero(numpy.diff(deck_ids, prepend=-1)) if len(deck_ids) else numpy.zeros(0, dtype=numpy.int64)
+        self.deck_ids = deck_ids[starts]
+        self.indptr = numpy.append(starts, len(deck_ids))
+        self.indices = card_ids.astype(numpy.int32)
+        self.data = quantities.astype(numpy.float32)
+        self.rows = numpy.repeat(numpy.arange(len(self.deck_ids), dtype=numpy.int32), numpy.diff(self.indptr))
+        self.norms = numpy.sqrt(numpy.bincount(self.rows, weights=self.data * self.data, minlength=len(self.deck_ids)))
+        self.sizes = numpy.diff(self.indptr)
+        self.alive = numpy.ones(len(self.deck_ids), dtype=bool)
+        self.row_of = {int(deck_id): row for row, deck_id in enumerate(self.deck_ids.tolist())}
+        self.pending: dict[int, dict[int, int]] = {}
+        self.loaded = True
+
+    def _compact(self) -> None:
+        numpy = _numpy()
+        keep = self.alive[self.rows]
+        deck_ids = [self.deck_ids[self.rows[keep]]]
+        card_ids = [self.indices[keep].astype(numpy.int64)]
+        quantities = [self.data[keep].astype(numpy.int64)]
+        for deck_id, card_quantities in self.pending.items():
+            deck_ids.append(numpy.full(len(card_quantities), deck_id, dtype=numpy.int64))
+            card_ids.append(numpy.fromiter(card_quantities.keys(), dtype=numpy.int64, count=len(card_quantities)))
+            quantities.append(numpy.fromiter(card_quantities.values(), dtype=numpy.int64, count=len(card_quantities)))
+        deck_ids, card_ids, quantities = numpy.concatenate(deck_ids), numpy.concatenate(card_ids), numpy.concatenate(quantities)
+        order = numpy.lexsort((card_ids, deck_ids))
+        self._set_entries(deck_ids[order], card_ids[order], quantities[order])
+
+    # Called after a deck was saved from this process. Does nothing if the index was never built
+    def update(self, deck_id: int, card_quantities: dict[int, int]) -> None:
+        if not self.loaded:
+            return
+        row = self.row_of.pop(deck_id, None)
+        if row is not None:
+            self.alive[row] = False
+        card_quantities = {card_id: quantity for card_id, quantity in card_quantities.items() if quantity > 0}
+        if card_quantities:
+            self.pending[deck_id] = card_quantities
+        else:
+            self.pending.pop(deck_id, None)
+        if len(self.pending) > MAX_PENDING:
+            self._compact()
+
+    def remove(self, deck_id: int) -> None:
+        self.update(deck_id, {})
+
+    def card_quantities(self, deck_id: int) -> dict[int, int]:
+        self._ensure_loaded()
+        if deck_id in self.pending:
+            return dict(self.pending[deck_id])
+        row = self.row_of.get(deck_id)
+        if row is None:
+            return {}
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return dict(zip(self.indices[start:end].tolist(), self.data[start:end].astype(int).tolist()))
+
+    # Top k decks by similarity to the given cards, as (deck id, similarity) with the most similar first.
+    # All stored decks are scored at once: the query becomes a dense vector indexed by card id, and the
+    # dot products (or shared card counts) of every row are summed with one bincount over the entries
+    def similar(self, card_quantities: dict[int, int], k: int = DEFAULT_TOP, metric: str = "cosine",
+                exclude: set[int] = frozenset()) -> list[tuple[int, float]]:
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {', '.join(METRICS)}")
+        numpy = _numpy()
+        self._ensure_loaded()
+        card_quantities = {card_id: quantity for card_id, quantity in card_quantities.items() if quantity > 0}
+        if not card_quantities:
+            return []
+        columns = max(int(self.indices.max()) + 1 if len(self.indices) else 0, max(card_quantities) + 1)
+        query = numpy.zeros(columns, dtype=numpy.float32)
+        query[list(card_quantities)] = list(card_quantities.values())
+        if metric == "cosine":
+            dots = numpy.bincount(self.rows, weights=self.data * query[self.indices], minlength=len(self.deck_ids))
+            query_norm = float(numpy.sqrt(numpy.dot(query, query)))
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                scores = dots / (self.norms * query_norm)
+        else:
+            shared = numpy.bincount(self.rows, weights=query[self.indices] > 0, minlength=len(self.deck_ids))
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                scores = shared / (self.sizes + len(card_quantities) - shared)
+        scores = numpy.where(self.alive & numpy.isfinite(scores), scores, -1.0)
+        for deck_id in exclude:
+            row = self.row_of.get(deck_id)
+            if row is not None:
+                scores[row] = -1.0
+        top = min(k, len(scores))
+        best = numpy.argpartition(-scores, top - 1)[:top] if top else numpy.zeros(0, dtype=numpy.int64)
+        results = [(int(self.deck_ids[row]), float(scores[row])) for row in best if scores[row] > 0]
+        results += [(deck_id, _similarity(card_quantities, cards, metric)) for deck_id, cards in self.pending.items()
+                    if deck_id not in exclude]
+        return sorted((result for result in results if result[1] > 0), key=lambda result: -result[1])[:k]
+
+    def similar_to_deck(self, deck_id: int, k: int = DEFAULT_TOP, metric: str = "cosine") -> list[tuple[int, float]]:
+        return self.similar(self.card_quantities(deck_id), k, metric, exclude={deck_id})
+
+# Same scores as DeckIndex.similar, for the few pending decks
+def _similarity(first: dict[int, int], second: dict[int, int], metric: str) -> float:
+    if metric == "cosine":
+        dot = sum(quantity * second.get(card_id, 0) for card_id, quantity in first.items())
+        norms = (sum(q * q for q in first.values()) * sum(q * q for q in second.values())) ** 0.5
+        return dot / norms if norms else 0.0
+    shared = len(first.keys() & second.keys())
+    return shared / len(first.keys() | second.keys())
+
+deck_index = DeckIndex()
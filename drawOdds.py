@@ -0,0 +1,155 @@
+import random
+from functools import lru_cache, partial
+from itertools import groupby
+from math import comb
+from typing import Iterable, Iterator
+
+from database import get_connection
+from cardCatalog import CARD_TYPES, REGIONS, MADNESS_VALUES
+
+OPENING_HAND_SIZE = 5
+DRAWS_PER_TURN = 1
+DEFAULT_TURNS = 5
+DEFAULT_SAMPLES = 1_000_000
+# shuffles simulated per numpy batch, a batch holds batch * deck size random keys
+BATCH_SIZE = 20_000
+# without numpy the shuffles are simulated one by one, so far fewer of them
+PYTHON_SAMPLES = 20_000
+MIN_DECKS_FOR_POOL = 16
+DEFAULT_CHUNK_SIZE = 8
+
+# A deck composition is a list of (type, region, madness, quantity), one entry per distinct card
+CONDITION_FIELDS = {"type": 0, "region": 1, "madness": 2}
+
+COMPOSITION_QUERY = '''
+    SELECT dc.deck_id, d.name, c.type, c.region, c.madness, dc.quantity
+    FROM deck_cards dc
+    INNER JOIN cards c ON c.id = dc.card_id
+    INNER JOIN decks d ON d.id = dc.deck_id
+    {where}
+    ORDER BY dc.deck_id
+'''
+
+def cards_seen(turn: int, opening_hand: int = OPENING_HAND_SIZE, draws_per_turn: int = DRAWS_PER_TURN) -> int:
+    return opening_hand + draws_per_turn * (turn - 1)
+
+# P(X >= k) for k = 0..draws when drawing `draws` cards without replacement from `population` cards
+# of which `successes` match. Tables are memoized since most decks share sizes and counts
+@lru_cache(maxsize=4096)
+def hypergeometric_table(population: int, successes: int, draws: int) -> tuple[float, ...]:
+    draws = min(draws, population)
+    total = comb(population, draws)
+    exact = [comb(successes, i) * comb(population - successes, draws - i) / total for i in range(draws + 1)]
+    at_least = [0.0] * (draws + 2)
+    for i in range(draws, -1, -1):
+        at_least[i] = min(1.0, at_least[i + 1] + exact[i])
+    return tuple(at_least)
+
+def probability_at_least(population: int, successes: int, draws: int, k: int) -> float:
+    if k <= 0:
+        return 1.0
+    table = hypergeometric_table(population, successes, draws)
+    return table[k] if k < len(table) else 0.0
+
+# Parses "madness=2", "region=town:2" or "type=creature:3" (field=value[:at least])
+def parse_condition(text: str) -> dict:
+    field, separator, value = text.partition("=")
+    field = field.strip()
+    if not separator or field not in CONDITION_FIELDS:
+        raise ValueError(f"Invalid condition '{text}', expected {'|'.join(CONDITION_FIELDS)}=<value>[:<at least>]")
+    value, _, at_least = value.partition(":")
+    value = value.strip()
+    if field == "madness":
+        value = int(value)
+    valid = {"type": CARD_TYPES, "region": REGIONS, "madness": MADNESS_VALUES}[field]
+    if value not in valid:
+        raise ValueError(f"Invalid {field} '{value}' in condition '{text}'")
+    return {"field": field, "value": value, "at_least": int(at_least) if at_least.strip() else 1}
+
+def describe_condition(condition: dict) -> str:
+    return f"{condition['field']}={condition['value']}:{condition['at_least']}"
+
+def _matches(card: tuple, condition: dict) -> bool:
+    return card[CONDITION_FIELDS[condition["field"]]] == condition["value"]
+
+# Exact for a single condition, Monte Carlo when every one of several conditions has to hold at once.
+# Returns the method used and the probability for each number of cards drawn
+def draw_probabilities(composition: list[tuple], conditions: list[dict], draws: list[int],
+                       samples: int = DEFAULT_SAMPLES, seed: int = None) -> tuple[str, list[float]]:
+    population = sum(card[3] for card in composition)
+    draws = [min(draw, population) for draw in draws]
+    if len(conditions) <= 1 or population == 0:
+        if not conditions:
+            return "exact", [1.0] * len(draws)
+        successes = sum(card[3] for card in composition if _matches(card, conditions[0]))
+        return "exact", [probability_at_least(population, successes, draw, conditions[0]["at_least"]) for draw in draws]
+    try:
+        import numpy
+    except ImportError:
+        return "monte carlo", _monte_carlo_python(composition, conditions, draws, min(samples, PYTHON_SAMPLES), seed)
+    return "monte carlo", _monte_carlo_numpy(numpy, composition, conditions, draws, samples, seed)
+
+# Shuffles are simulated in batches: one row of random keys per shuffle, argsort gives the drawing order,
+# and a cumulative sum over the drawn cards gives the matching counts after every draw at once
+def _monte_carlo_numpy(numpy, composition: list[tuple], conditions: list[dict], draws: list[int], samples: int, seed: int) -> list[float]:
+    cards = [card for card in composition for _ in range(card[3])]
+    masks = numpy.array([[_matches(card, condition) for card in cards] for condition in conditions], dtype=numpy.int16)
+    at_least = numpy.array([condition["at_least"] for condition in conditions])[:, None, None]
+    max_draws = max(draws)
+    rng = numpy.random.default_rng(seed)
+    hits = numpy.zeros(max_draws + 1, dtype=numpy.int64)
+    done = 0
+    while done < samples:
+        batch = min(BATCH_SIZE, samples - done)
+        drawn = numpy.argsort(rng.random((batch, len(cards))), axis=1)[:, :max_draws]
+        counts = masks[:, drawn].cumsum(axis=2)
+        hits[1:] += numpy.all(counts >= at_least, axis=0).sum(axis=0)
+        done += batch
+    return [float(hits[draw]) / samples if draw > 0 else float(all(condition["at_least"] <= 0 for condition in conditions))
+            for draw in draws]
+
+def _monte_carlo_python(composition: list[tuple], conditions: list[dict], draws: list[int], samples: int, seed: int) -> list[float]:
+    cards = [card for card in composition for _ in range(card[3])]
+    rng = random.Random(seed)
+    hits = [0] * len(draws)
+    for _ in range(samples):
+        shuffled = rng.sample(cards, max(draws))
+        for i, draw in enumerate(draws):
+            hand = shuffled[:draw]
+            if all(sum(1 for card in hand if _matches(card, condition)) >= condition["at_least"] for condition in conditions):
+                hits[i] += 1
+    return [hit / samples for hit in hits]
+
+# Streams (deck id, name, composition) for the given decks (every deck if None)
+def iter_deck_compositions(deck_ids: list[int] = None) -> Iterator[tuple[int, str, list[tuple]]]:
+    if deck_ids is None:
+        cursor = get_connection().execute(COMPOSITION_QUERY.format(where=""))
+    else:
+        cursor = get_connection().execute(COMPOSITION_QUERY.format(where="WHERE dc.deck_id IN (SELECT value FROM json_each(?))"),
+                                          (f"[{','.join(str(int(deck_id)) for deck_id in deck_ids)}]",))
+    for (deck_id, name), rows in groupby(cursor, key=lambda row: (row[0], row[1])):
+        yield deck_id, name, [tuple(row[2:]) for row in rows]
+
+def analyze_deck(deck: tuple[int, str, list[tuple]], conditions: list[dict], turns: int = DEFAULT_TURNS,
+                 samples: int = DEFAULT_SAMPLES, seed: int = None) -> dict:
+    deck_id, name, composition = deck
+    method, probabilities = draw_probabilities(composition, conditions, [cards_seen(turn) for turn in range(1, turns + 1)], samples, seed)
+    return {"id": deck_id, "name": name, "cards": sum(card[3] for card in composition), "method": method,
+            "probabilities": probabilities}
+
+# Analyzes many decks, in a process pool when there are enough of them (same pattern as bulkImport.parse_deck_files)
+def analyze_decks(decks: Iterable[tuple], conditions: list[dict], turns: int = DEFAULT_TURNS, samples: int = DEFAULT_SAMPLES,
+                  seed: int = None, workers: int = None) -> Iterator[dict]:
+    analyze = partial(analyze_deck, conditions=conditions, turns=turns, samples=samples, seed=seed)
+    decks = list(decks)
+    if len(decks) < MIN_DECKS_FOR_POOL or workers == 1:
+        yield from map(analyze, decks)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(analyze, decks, chunksize=DEFAULT_CHUNK_SIZE)
+
+# Exact chance of having drawn at least one card of each madness value, for the deck view
+def madness_odds(madness_counts: dict[int, int], total: int, turns: int = DEFAULT_TURNS) -> dict[int, list[float]]:
+    return {madness: [probability_at_least(total, count, cards_seen(turn), 1) for turn in range(1, turns + 1)]
+            for madness, count in madness_counts.items() if count}
@@ -0,0 +1,147 @@
+import csv
+import io
+import json
+import os
+import re
+import time
+from itertools import groupby
+from operator import itemgetter
+from typing import Iterator
+
+from cardCatalog import card_catalog
+from deck import Deck
+from database import get_connection
+from deckCode import encode_deck_code
+from matchLog import match_log
+
+FORMATS = ["untap", "jsonl", "csv"]
+CSV_COLUMNS = ["deck_id", "deck_name", "wins", "games", "card_id", "card_name", "quantity"]
+
+# gzip's default level 9 is several times slower than 6 for a few percent smaller files
+GZIP_LEVEL = 6
+
+# Both come out in deck id order (the cards through the (deck_id, card_id) index), so SQLite streams the rows
+# without sorting and they are merged on the fly with a single deck in memory at a time. Card names come from
+# the catalog, which is cheaper than joining cards on millions of rows
+LIBRARY_DECKS_QUERY = 'SELECT id, name, wins, games FROM decks ORDER BY id'
+LIBRARY_CARDS_QUERY = 'SELECT deck_id, card_id, quantity FROM deck_cards ORDER BY deck_id, card_id'
+
+# Streams every deck as a dict with id, name, wins, games and cards: [(card id, card name, quantity)].
+# Both queries run in one read transaction, so they see the same snapshot of the database
+def iter_library() -> Iterator[dict]:
+    match_log.flush()
+    cards_by_id = card_catalog.refresh().by_id
+    conn = get_connection()
+    began = not conn.in_transaction
+    if began:
+        conn.execute('BEGIN')
+    try:
+        decks = conn.cursor()
+        decks.row_factory = None
+        cards = conn.cursor()
+        cards.row_factory = None
+        card_groups = groupby(cards.execute(LIBRARY_CARDS_QUERY), key=itemgetter(0))
+        group = next(card_groups, None)
+        for deck_id, name, wins, games in decks.execute(LIBRARY_DECKS_QUERY):
+            deck_cards = []
+            while group is not None and group[0] <= deck_id:
+                if group[0] == deck_id:
+                    deck_cards = [(card_id, cards_by_id[card_id]["name"], quantity) for _, card_id, quantity in group[1]]
+                group = next(card_groups, None)
+            yield {"id": deck_id, "name": name, "wins": wins, "games": games, "cards": deck_cards}
+    finally:
+        if began:
+            conn.rollback()
+
+def write_untap(name: str, cards: list[tuple[str, int]], file) -> None:
+    file.write(f'//{name}\n')
+    for card_name, quantity in cards:
+        file.write(f"{quantity} {card_name} (se1)\n")
+
+def write_untap_deck(deck: Deck, file) -> None:
+    write_untap(deck.name, [(card["name"], quantity) for card, quantity in deck.entries()], file)
+
+# Deck id first, so decks with the same name (or names that differ only in unsafe characters) never collide
+def untap_file_name(deck: dict) -> str:
+    safe_name = re.sub(r"[^\w\- ]+", "_", deck["name"]).strip() or "deck"
+    return f"{deck['id']}-{safe_name[:80]}.txt"
+
+def _untap_text(deck: dict) -> str:
+    out = io.StringIO()
+    write_untap(deck["name"], [(card_name, quantity) for _, card_name, quantity in deck["cards"]], out)
+    return out.getvalue()
+
+def _write_untap_folder(decks: Iterator[dict], folder: str) -> None:
+    os.makedirs(folder, exist_ok=True)
+    for deck in decks:
+        with open(os.path.join(folder, untap_file_name(deck)), "w") as file:
+            file.write(_untap_text(deck))
+
+# Every untap file in one .tar.gz, member by member
+def _write_untap_archive(decks: Iterator[dict], archive_name: str) -> None:
+    import tarfile
+    now = time.time()
+    with tarfile.open(archive_name, "w:gz", compresslevel=GZIP_LEVEL) as archive:
+        for deck in decks:
+            data = _untap_text(deck).encode()
+            member = tarfile.TarInfo(untap_file_name(deck))
+            member.size = len(data)
+            member.mtime = now
+            archive.addfile(member, io.BytesIO(data))
+
+def _write_jsonl(decks: Iterator[dict], file) -> None:
+    for deck in decks:
+        cards = [{"id": card_id, "name": card_name, "quantity": quantity} for card_id, card_name, quantity in deck["cards"]]
+        code = encode_deck_code({card_id: quantity for card_id, _, quantity in deck["cards"]})
+        file.write(json.dumps({"id": deck["id"], "name": deck["name"], "wins": deck["wins"], "games": deck["games"],
+                               "code": code, "cards": cards}) + "\n")
+
+# One row per card, decks without cards get a single row with empty card columns
+def _write_csv(decks: Iterator[dict], file) -> None:
+    writer = csv.writer(file)
+    writer.writerow(CSV_COLUMNS)
+    for deck in decks:
+        deck_columns = [deck["id"], deck["name"], deck["wins"], deck["games"]]
+        writer.writerows([deck_columns + list(card) for card in deck["cards"]] or [deck_columns + ["", "", ""]])
+
+def _open_output(output: str, compress: bool):
+    if compress:
+        import gzip
+        return gzip.open(output, "wt", compresslevel=GZIP_LEVEL, encoding="utf-8", newline="")
+    return open(output, "w", encoding="utf-8", newline="")
+
+# Format from the output name when not given: .jsonl and .csv (optionally .gz), untap otherwise
+def guess_format(output: str) -> str:
+    name = output[:-len(".gz")] if output.endswith(".gz") else output
+    for export_format in ("jsonl", "csv"):
+        if name.endswith("." + export_format):
+            return export_format
+    return "untap"
+
+# Writes the whole library to `output`: a folder of untap files (a .tar.gz of them with compress),
+# or a single JSON lines or CSV file (gzipped with compress). Returns how many decks and cards were written
+def export_library(output: str, export_format: str = None, compress: bool = None) -> dict:
+    start = time.perf_counter()
+    export_format = export_format or guess_format(output)
+    if export_format not in FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}', expected one of {', '.join(FORMATS)}")
+    compress = output.endswith(".gz") if compress is None else compress
+    report = {"output": output, "format": export_format, "gzip": compress, "decks": 0, "cards": 0}
+
+    def counted(decks: Iterator[dict]) -> Iterator[dict]:
+        for deck in decks:
+            report["decks"] += 1
+            report["cards"] += sum(quantity for *_, quantity in deck["cards"])
+            yield deck
+
+    decks = counted(iter_library())
+    if export_format == "untap":
+        if compress:
+            _write_untap_archive(decks, output)
+        else:
+            _write_untap_folder(decks, output)
+    else:
+        with _open_output(output, compress) as file:
+            (_write_jsonl if export_format == "jsonl" else _write_csv)(decks, file)
+    report["seconds"] = time.perf_counter() - start
+    return report
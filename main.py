@@ -1,12 +1,36 @@
-import sqlite3
-from prettytable import from_db_cursor, TableStyle, HRuleStyle, PrettyTable
-from menuManager import createMenu
+# Modules that serve a single menu option (bulk import, library export, the in-memory card store, card name suggestions,
+# the auto-builder, draw odds and similar decks) are imported by that option, `python benchmark.py --startup` checks they stay lazy
+import os
+import sys
+from typing import Iterable
+from menuManager import createMenu, CachedIntro, marks_dirty
+import profiler
+from cardCatalog import card_catalog, CARD_TYPES, REGIONS, MADNESS_VALUES
+from deck import Deck
+from deckCode import decode_deck_code
+from queryCache import card_query_cache, normalize_params
+from pagedTable import PagedTable, page_through
 
 import repository
 
-CARD_TYPES = ["creature", "event", "permanent"]
-REGIONS = ["dungeon", "graveyard", "academy", "fishing hamlet", "church", "town", "forest"]
-DB_FILE_NAME = repository.DB_FILE_NAME
+# Runs the deck and card operations of the menus on this process's database, or on a deck server after connect()
+client = None
+
+def call(op: str, **params):
+    global client
+    if client is None:
+        from deckServer import LocalClient
+        client = LocalClient()
+    return client.call(op, **params)
+
+# Sends the operations (and the card catalog reads) to a running deck server, so every terminal
+# shares the server's connections instead of locking cards.db itself. Returns the client
+def connect(address: str):
+    global client
+    from deckServer import RemoteClient
+    client = RemoteClient(address)
+    card_catalog.use_client(client)
+    return client
 
 def create_main_menu():
     print("Welcome to Insight Apparatus, the Sanity's End Deck Builder!\n")
@@ -15,36 +39,50 @@ def create_main_menu():
             "View your decks": view_decks_menu,
             "List the cards": list_cards,
             "Create a deck": create_deck_menu,
+            "Build a deck automatically (from constraints)": auto_build_deck_menu,
             "Import deck (from file in untap deck format)": import_from_untap,
+            "Import deck (from a deck code)": import_deck_code,
+            "Import decks in bulk (every untap file in a folder)": import_decks_from_folder,
             "Exit": lambda: print("Exiting program")
         })
 
 def view_decks_menu() -> str:
-    createMenu(deck_viewing_intro, {
-        "View a deck": view_deck,
-        "Edit a deck": edit_deck,
-        "Delete a deck": delete_deck,
-        "Create a new deck": create_deck_menu,
+    intro = CachedIntro(deck_viewing_intro)
+    createMenu(intro, {
+        "View a deck": marks_dirty(intro, view_deck),
+        "Browse all decks": browse_decks,
+        "Edit a deck": marks_dirty(intro, edit_deck),
+        "Delete a deck": marks_dirty(intro, delete_deck),
+        "Create a new deck": marks_dirty(intro, create_deck_menu),
+        "Export all decks (untap files, JSON lines or CSV)": export_all_decks,
         "Return to the Main Menu": no_op
     })
     return "Returning to main menu"
 
+# Only the first page is printed here, since the introduction is printed again after every option
 def deck_viewing_intro() -> str:
-    repository.print_all_decks()
+    if not repository.print_deck_table(call("decks"), pause=False, max_pages=1):
+        print("More decks not shown, choose 'Browse all decks' to page through them")
     return "Would you like to:"
 
+def browse_decks() -> str:
+    repository.print_deck_table(call("decks"))
+    return "Finished browsing the decks"
+
 def view_deck() -> str:
-    chosen_deck = input("Which deck do you want to view?\n")
-    try:
-        id = int(chosen_deck)
-    except TypeError as e:
-        id = int(repository.find_deck_id_by_name(chosen_deck))
-    deck = {"id": id}
-    createMenu(single_deck_view_intro,{
-        "Register Win": register_win,
-        "Register Loss": register_loss,
-        "Edit deck": edit_deck_menu,
-        "Delete deck": delete_deck_with_id,
+    chosen_deck = input("Which deck do you want to view?\n").strip()
+    deck_id = call("resolve_deck", deck=chosen_deck)
+    if deck_id is None:
+        return f"Deck '{chosen_deck}' not found"
+    deck = {"id": deck_id}
+    intro = CachedIntro(single_deck_view_intro)
+    createMenu(intro,{
+        "Register Win": marks_dirty(intro, register_win),
+        "Register Loss": marks_dirty(intro, register_loss),
+        "Edit deck": marks_dirty(intro, edit_deck_menu),
+        "Find similar decks": find_similar_decks,
+        "Show deck code": show_deck_code,
+        "Delete deck": lambda deck: print(delete_deck_with_id(deck)),
         "Return to previous menu": lambda _: no_op()
     }, intro_arg=deck, option_func_arg=deck)
     return "Returning to previous menu"
@@ -52,51 +90,70 @@ def view_deck() -> str:
 # Mutates deck input arg
 def single_deck_view_intro(deck) -> str:
     deck_id: int = deck["id"]
-    analysis = repository.get_deck_analysis_by_id(deck_id)
+    analysis = call("deck_stats", deck_id=deck_id)
     deck["analysis"] = analysis
     stats = analysis["stats"]
     print(stats["name"] + ":")
-    repository.print_deck_cards_by_id(deck_id)
+    repository.print_cards_in_deck_table(call("deck_cards", deck_id=deck_id), pause=False)
     if stats["games"] != 0:
         print(f'Wins: {stats["wins"]}\tGames: {stats["games"]}\tWin rate: {100*stats["wins"]/stats["games"]} %')
-
+        table = call("matchups", deck_id=deck_id)
+        matchups = [matchup for matchup in (dict(zip(table["columns"], row)) for row in table["rows"]) if matchup["opponent"]]
+        if matchups:
+            print("Matchups")
+            for matchup in matchups:
+                print(f'  vs {matchup["opponent"]}: {matchup["wins"]}/{matchup["games"]} ({matchup["win_rate"]} %)')
+
+    total = stats["total"] if stats["total"] else 1
     print("------------------------")
     print("Regions")
     for region in analysis["regions"]:
-        print(f"{region}: {stats[region]} ({100*stats[region]/stats['total']} %)")
+        print(f"{region}: {stats[region]} ({100*stats[region]/total} %)")
         
     print("------------------------")
     print("Card Types")
     for card_type in CARD_TYPES:
-        if stats[card_type] is not None:
-            print(f"{card_type}: {stats[card_type]} ({100*stats[card_type]/stats["total"]} %)")
+        if stats[card_type]:
+            print(f"{card_type}: {stats[card_type]} ({100*stats[card_type]/total} %)")
 
     print("------------------------")
     print("Madness Curve")
-    for i in range(6):
-        collumn_name = f"mad_{i}"
-        madness = 0 if stats[collumn_name] is None else stats[collumn_name] 
-        print(f"{i}: {madness} {'-'*madness} ({100*madness/stats["total"]} %)")
+    for i in MADNESS_VALUES:
+        madness = stats[f"mad_{i}"]
+        print(f"{i}: {madness} {'-'*madness} ({100*madness/total} %)")
+
+    if stats["total"]:
+        from drawOdds import madness_odds, OPENING_HAND_SIZE, DRAWS_PER_TURN, DEFAULT_TURNS
+        print("------------------------")
+        print(f"Chance of having drawn a card of each madness (opening hand of {OPENING_HAND_SIZE}, {DRAWS_PER_TURN} draw per turn)")
+        odds = madness_odds({i: stats[f"mad_{i}"] for i in MADNESS_VALUES}, stats["total"])
+        print("turn:  " + "".join(f"{turn:>8}" for turn in range(1, DEFAULT_TURNS + 1)))
+        for i, probabilities in odds.items():
+            print(f"{i}:     " + "".join(f"{100*probability:7.1f}%" for probability in probabilities))
 
-    input("Press Enter to continue\n")
     return "What do you want to do with this Deck?"
 
+def find_similar_decks(deck) -> str:
+    from deckServer import ServerError
+    try:
+        similar = list(call("similar_decks", deck_id=deck["id"])["rows"])
+    except (RuntimeError, ServerError) as e:
+        return str(e)
+    if not similar:
+        return "No similar decks found"
+    for deck_id, name, similarity in similar:
+        print(f"{100*similarity:5.1f} %  {deck_id}: {name}")
+    return f"Found {len(similar)} similar decks"
+
+def show_deck_code(deck) -> str:
+    print(call("deck_code", deck_id=deck["id"]))
+    return "Paste this code in 'Import deck (from a deck code)' to copy the deck"
+
 def create_deck_menu() -> str:
     name = input("Enter the name of the deck: ")
-    deck = {
-        "name": name,
-        "total": 0,
-        "cards": [],
-        "regions": [],
-        "madness": [],
-        "types": [
-            {"name": "creature", "quantity": 0},
-            {"name": "event", "quantity": 0},
-            {"name": "permanent", "quantity": 0}
-        ],
-    }
-    for i in range(6):
-        deck["madness"].append(0)
+    return deck_editing_menu(Deck(name))
+
+def deck_editing_menu(deck: Deck) -> str:
     createMenu(create_deck_intro,{
         "Add a card": add_card_to_deck,
         "Remove a card": remove_card_from_deck,
@@ -107,29 +164,53 @@ def create_deck_menu() -> str:
     }, intro_arg=deck, option_func_arg=deck)
     return "Returning to previous menu"
 
+def auto_build_deck_menu() -> str:
+    import autoBuilder
+    name = input("Enter the name of the deck: ")
+    try:
+        constraints = {"size": int(input(f"How many cards? (Enter for {autoBuilder.DEFAULT_DECK_SIZE})\n").strip() or autoBuilder.DEFAULT_DECK_SIZE)}
+        constraints["regions"] = autoBuilder.parse_regions(input(f"Regions, comma separated (Enter for any): {', '.join(REGIONS)}\n"))
+        curve = input(f"Madness curve, a weight for each madness {MADNESS_VALUES[0]}-{MADNESS_VALUES[-1]} like 4,8,10,8,6,4 (Enter for any)\n").strip()
+        constraints["madness_curve"] = autoBuilder.parse_madness_curve(curve) if curve else None
+        ratios = input("Type ratios like creature=0.6,event=0.2,permanent=0.2 (Enter for any)\n").strip()
+        constraints["type_ratios"] = autoBuilder.parse_type_ratios(ratios) if ratios else None
+        cards = input("Cards that must be included, separated by ';' like Insight:2;Feed (Enter for none)\n")
+        card_catalog.refresh()
+        constraints["must_include"] = dict(autoBuilder.parse_card_quantity(card) for card in cards.split(";") if card.strip())
+        print("Searching...")
+        candidates = autoBuilder.build_decks(constraints, name)
+    except ValueError as e:
+        return str(e)
+    for i, (score, deck) in enumerate(candidates):
+        print(f"\n\nCandidate {i+1} (distance to the targets: {score:.1f})")
+        generate_partial_deck_view(deck)
+    chosen = input("\nWhich candidate do you want to keep? (Enter to discard them)\n").strip()
+    if not chosen.isdigit() or not 1 <= int(chosen) <= len(candidates):
+        return "Candidates discarded"
+    return deck_editing_menu(candidates[int(chosen) - 1][1])
+
 def create_deck_intro(deck) -> str:
     generate_partial_deck_view(deck)
     return "What do you want to do?"
 
-def generate_partial_deck_view(deck) -> None:
-    if deck["total"] == 0:
+def generate_partial_deck_view(deck: Deck) -> None:
+    if deck.total == 0:
         return
-    print(f"\n\nYour current deck: {deck['name']}")
+    print(f"\n\nYour current deck: {deck.name}")
     print("-------------------------------")
     print("Cards per region:")
-    for region in deck["regions"]:
-        print(f"{region['quantity']} - {region['name']}")
+    for region, quantity in deck.regions():
+        print(f"{quantity} - {region}")
     print('\nCards per type:')
-    for type in deck["types"]:
-        print(f"{type['quantity']} - {type['name']}")
+    for card_type, quantity in deck.types():
+        print(f"{quantity} - {card_type}")
     print("\nMadness Curve:")
-    for i in range(6):
-        mad = deck["madness"][i]
+    for i, mad in enumerate(deck.madness_counts):
         print(f"{i}: {mad} {'-'*mad} ")
 
-    print(f"\nCards in deck ({deck['total']}):")
-    for card in deck["cards"]:
-        print(f"{card['quantity']}x {card['name']} - {card['region']} {card['type']}")
+    print(f"\nCards in deck ({deck.total}):")
+    for card, quantity in deck.entries():
+        print(f"{quantity}x {card['name']} - {card['region']} {card['type']}")
 
 def edit_deck_menu(deck_analysis) -> str:
     print(deck_analysis)
@@ -144,250 +225,167 @@ def edit_deck_menu(deck_analysis) -> str:
     }, intro_arg=deck, option_func_arg=deck)
     return "Returning to previous menu"
 
-def create_in_memory_deck_from_analysis(deck_view) -> dict:
-    deck_anlysis = deck_view["analysis"]
-    creature_quantity = deck_anlysis["stats"]["creature"]
-    permanent_quantity = deck_anlysis["stats"]["permanent"]
-    event_quantity = deck_anlysis["stats"]["event"]
-    deck = {
-        "id": deck_view["id"],
-        "name": deck_anlysis["stats"]["name"],
-        "total": deck_anlysis["stats"]["total"],
-        "regions": [],
-        "cards": [],
-        "madness": [],
-        "types": [
-            {"name": "creature", "quantity": creature_quantity if creature_quantity != None else 0},
-            {"name": "event", "quantity": event_quantity if event_quantity != None else 0},
-            {"name": "permanent", "quantity": permanent_quantity if permanent_quantity != None else 0}
-        ],
-    }
-    for i in range(6):
-        madness = deck_anlysis["stats"][f"mad_{i}"]
-        deck["madness"].append(madness if madness is not None else 0)
-    cards = repository.get_cards_for_deck_id(deck_view["id"])
-    for card in cards:
-        deck["cards"].append({
-            "id": card["id"],
-            "name": card["name"],
-            "region": card["region"],
-            "type": card["type"],
-            "madness": card["madness"],
-            "quantity": card["quantity"]
-        })
-    for region in deck_anlysis["regions"]:
-        deck["regions"].append({
-            "name": region,
-            "quantity": deck_anlysis["stats"][region]
-        })
-    return deck
+def create_in_memory_deck_from_analysis(deck_view) -> Deck:
+    card_catalog.refresh()
+    table = call("deck_cards", deck_id=deck_view["id"])
+    cards = (dict(zip(table["columns"], row)) for row in table["rows"])
+    return Deck.from_card_quantities(deck_view["analysis"]["stats"]["name"], {card["id"]: card["quantity"] for card in cards}, deck_view["id"])
 
 def register_win(deck) -> str:
     deck_id = deck["id"]
-    repository.register_win_for_deck(deck_id)
+    call("register_result", deck_id=deck_id, result="win", opponent=input_opponent())
     return "Registered a Win for the Deck!"
 
 def register_loss(deck) -> str:
     deck_id = deck["id"]
-    repository.register_loss_for_deck(deck_id)
+    call("register_result", deck_id=deck_id, result="loss", opponent=input_opponent())
     return "Registered a Loss for the Deck"
 
+def input_opponent() -> str:
+    return input("Opponent deck or region (Enter to skip):\n").strip()
+
 def delete_deck() -> str:
-    deck = input("Which deck do you wish to delete?\n")
-    try:
-        deck_id = int(deck)
-    except TypeError:
-        deck_id = repository.find_deck_id_by_name(deck)
+    deck = input("Which deck do you wish to delete?\n").strip()
+    deck_id = call("resolve_deck", deck=deck)
+    if deck_id is None:
+        return f"Deck '{deck}' not found"
     return delete_deck_with_id(deck_id)
 
 def delete_deck_with_id(deck) -> str:
     deck_id = deck["id"] if isinstance(deck, dict) else deck
-    repository.delete_deck_by_id(deck_id)
+    call("delete_deck", deck_id=deck_id)
     return f"Deck with id {deck_id} deleted"
 
-def add_card_to_deck(deck) -> str:
-    with sqlite3.connect(DB_FILE_NAME) as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        card_name = input("Enter the name of the card: ")
-        cursor.execute('SELECT * FROM cards where lower(name) = ? limit 1', (card_name.lower().strip(),))
-        card = cursor.fetchone()
-        if not card:
-            return f"Card '{card_name}' not found"
-        else:
-            card_region = card["region"]
-            card_type = card["type"]
-            card_quantity = int(input(f"How many copies of {card_name} do you want to add?\n"))
-            card_exists = False
-            add_quantity = 0
-            for existing_card in deck["cards"]:
-                if existing_card["name"] == card_name:
-                    add_quantity = min(card_quantity + existing_card["quantity"], 2)
-                    existing_card["quantity"] = add_quantity
-                    deck["total"] += add_quantity - existing_card["quantity"]
-                    card_exists = True
-                    break
-            if not card_exists:
-                add_quantity= min(card_quantity, 2)
-                deck["cards"].append({
-                    "id": card["id"],
-                    "name": card["name"],
-                    "region": card_region,
-                    "type": card_type,
-                    "madness": card["madness"],
-                    "quantity": add_quantity
-                })
-                deck["total"] += add_quantity
-            deck["madness"][card["madness"]] += add_quantity
-            region_exists = False
-            for region in deck["regions"]:
-                if region["name"] == card_region:
-                    region["quantity"] += add_quantity
-                    region_exists = True
-                    break
-            if not region_exists:
-                deck["regions"].append({
-                    "name": card_region,
-                    "quantity": add_quantity
-                })
-            for type in deck["types"]:
-                if type["name"] == card_type:
-                    type["quantity"] += add_quantity
-                    break
-            return f"Added {add_quantity} {card['name']} to Deck" 
-
-def remove_card_from_deck(deck) -> str:
+def add_card_to_deck(deck: Deck) -> str:
     card_name = input("Enter the name of the card: ")
-    for existing_card in deck["cards"]:
-        if existing_card["name"].lower() == card_name.lower().strip():
-            card_region = existing_card["region"]
-            card_type = existing_card["type"]
-            card_quantity = int(input(f"How many copies of {existing_card['name']} do you want to remove?\n"))
-            if card_quantity > existing_card["quantity"]:
-                card_quantity = existing_card["quantity"]
-            deck["total"] -= card_quantity
-            existing_card["quantity"] -= card_quantity
-            if existing_card["quantity"] == 0:
-                deck["cards"].remove(existing_card)
-            deck["madness"][existing_card["madness"]] -= card_quantity
-            for region in deck["regions"]:
-                if region["name"] == card_region:
-                    region["quantity"] -= card_quantity
-                    if region["quantity"] == 0:
-                        deck["regions"].remove(region)
-                    break
-            for type in deck["types"]:
-                if type["name"] == card_type:
-                    type["quantity"] -= card_quantity
-                    break
-            return f"{card_quantity} '{existing_card['name']}' were removed from the Deck"
-    return f"Card '{card_name}' not found in your deck."
-
-def save_deck(deck) -> str:
-    with sqlite3.connect(DB_FILE_NAME) as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute('SELECT id FROM decks where name = ? limit 1', (deck["name"],))
-        existing_deck = cursor.fetchone()
-        if existing_deck:
-            deck_id = existing_deck["id"]
-        else:
-            cursor.execute('INSERT INTO decks (name) VALUES (?)', (deck["name"],))
-            conn.commit()
-            cursor.execute('SELECT id FROM decks where name = ? limit 1', (deck["name"],))
-            deck_id = cursor.fetchone()["id"]
-        cursor.execute('DELETE FROM deck_cards WHERE deck_id = ?', (deck_id,))
-        for card in deck["cards"]:
-            cursor.execute('INSERT INTO deck_cards (deck_id, card_id, quantity) VALUES (?, ?, ?)', (deck_id, card["id"], card["quantity"]))
-        conn.commit()
-        return "Deck saved successfully!"
-
-def export_to_untap(deck) -> str:
+    card = card_catalog.refresh().find_by_name(card_name) or choose_similar_card(card_name)
+    if not card:
+        return f"Card '{card_name}' not found"
+    card_quantity = int(input(f"How many copies of {card['name']} do you want to add?\n"))
+    add_quantity = deck.add(card, card_quantity)
+    return f"Added {add_quantity} {card['name']} to Deck"
+
+# Lists the cards with the most similar names and returns the one picked, or None
+def choose_similar_card(card_name: str) -> dict | None:
+    from cardNameIndex import get_card_name_index
+    suggestions = get_card_name_index().suggest(card_name)
+    if not suggestions:
+        return None
+    print(f"Card '{card_name}' not found, did you mean:")
+    for i, (card, similarity) in enumerate(suggestions, 1):
+        print(f"{i}. {card['name']} ({100*similarity:.0f} % similar)")
+    choice = input("Enter the number of the card (Enter for none): ").strip()
+    if not choice.isdigit() or not 1 <= int(choice) <= len(suggestions):
+        return None
+    return suggestions[int(choice) - 1][0]
+
+def remove_card_from_deck(deck: Deck) -> str:
+    card_name = input("Enter the name of the card: ")
+    card = card_catalog.refresh().find_by_name(card_name)
+    if not card or deck.quantity_of(card["id"]) == 0:
+        return f"Card '{card_name}' not found in your deck."
+    card_quantity = int(input(f"How many copies of {card['name']} do you want to remove?\n"))
+    removed_quantity = deck.remove(card, card_quantity)
+    return f"{removed_quantity} '{card['name']}' were removed from the Deck"
+
+def save_deck(deck: Deck) -> str:
+    deck.id = call("save_deck", name=deck.name, cards=deck.card_quantities())
+    return "Deck saved successfully!"
+
+def export_to_untap(deck: Deck) -> str:
     file_name = input("Enter the name for the file to save to:")
+    from libraryExport import write_untap_deck
     with open(file_name + ".txt", "w") as file:
-        file.write(f'//{deck["name"]}\n')
-        for card in deck["cards"]:
-            file.write(f"{card["quantity"]} {card["name"]} (se1)\n")
+        write_untap_deck(deck, file)
     return f'Saved to file {file_name}.txt'
 
-def import_from_untap():
+def export_all_decks() -> str:
+    output = input("Enter the folder (untap files), or a .jsonl or .csv file, to export to (add .gz to compress):\n").strip()
+    report = call("export_library", output=os.path.abspath(output))
+    return f"Exported {report['decks']} decks ({report['cards']} cards) to {output}"
+
+def import_from_untap() -> str:
     file_name = input("Enter the name of the file to import: ")
+    deck, messages = import_untap_file(file_name)
+    return show_import_messages(deck, messages)
+
+# The untap import of the menu without its prompt and prints: reads the file, resolving misspelled card names,
+# and saves the deck. Returns the deck and the messages to show, the last one says whether it was imported
+def import_untap_file(file_name: str) -> tuple[Deck, list[str]]:
+    from bulkImport import parse_untap_line
+    from cardNameIndex import get_card_name_index
+    card_catalog.refresh()
+    messages = []
     with open(file_name, "r") as file:
-        lines = file.readlines()
-        deck_name = lines[0].replace("//", "").strip()
-        deck = {
-            "name": deck_name,
-            "total": 0,
-            "cards": [],
-            "regions": [],
-            "types": [
-                {"name": "creature", "quantity": 0},
-                {"name": "event", "quantity": 0},
-                {"name": "permanent", "quantity": 0}
-            ],
-        }
-        skipped = []
-        for line in lines[1:]:
-            quantity = int(line.split(" ")[0])
-            card_name = " ".join(line.split(" ")[1:]).split("(")[0]
-            with sqlite3.connect(DB_FILE_NAME) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM cards where lower(name) = ? limit 1', (card_name.lower().strip(),))
-                card = cursor.fetchone()
-                if not card:
-                    skipped.append(f"Card '{card_name}' not found, skipping...")
-                else:
-                    card_region = card["region"]
-                    card_type = card["type"]
-                    card_id = card["id"]
-                    card_exists = False
-                    for existing_card in deck["cards"]:
-                        if existing_card["name"] == card_name:
-                            add_quantity = max(existing_card["quantity"], quantity)
-                            existing_card["quantity"] = add_quantity
-                            deck["total"] += add_quantity - existing_card["quantity"]
-                            card_exists = True
-                            break
-                    if not card_exists:
-                        add_quantity= min(quantity, 2)
-                        deck["cards"].append({
-                            "id": card_id,
-                            "name": card_name,
-                            "region": card_region,
-                            "type": card_type,
-                            "quantity": add_quantity
-                        })
-                        deck["total"] += add_quantity
-                    region_exists = False
-                    for region in deck["regions"]:
-                        if region["name"] == card_region:
-                            region["quantity"] += quantity
-                            region_exists = True
-                            break
-                    if not region_exists:
-                        deck["regions"].append({
-                            "name": card_region,
-                            "quantity": quantity
-                        })
-                    for type in deck["types"]:
-                        if type["name"] == card_type:
-                            type["quantity"] += quantity
-                            break
-        save_deck(deck)
+        deck_name = file.readline().replace("//", "").strip()
+        deck = Deck(deck_name)
+        for line in file:
+            parsed = parse_untap_line(line)
+            if parsed is None:
+                continue
+            quantity, card_name = parsed
+            card = card_catalog.find_by_name(card_name)
+            if not card and (match := get_card_name_index().resolve(card_name)):
+                card = match[0]
+                messages.append(f"Card '{card_name}' not found, imported as '{card['name']}'")
+            if not card:
+                messages.append(f"Card '{card_name}' not found, skipping...")
+            else:
+                deck.set_quantity(card, max(deck.quantity_of(card["id"]), quantity))
+    return deck, messages + save_imported_deck(deck)
+
+def import_decks_from_folder() -> str:
+    from bulkImport import print_import_report
+    path = input("Enter the folder (or glob pattern) with the deck files: ")
+    report = call("import", path=os.path.abspath(path))
+    print_import_report(report)
+    return f"Imported {report['decks']} decks"
+
+def import_deck_code() -> str:
+    code = input("Enter the deck code: ")
+    try:
+        card_quantities = decode_deck_code(code)
+    except ValueError as e:
+        return str(e)
+    card_catalog.refresh()
+    if not card_quantities:
+        return f"Deck code '{code.strip()}' has no cards"
+    deck = Deck.from_card_quantities(input("Enter the name of the deck: "), card_quantities)
+    if not deck.quantities:
+        return f"None of the cards of deck code '{code.strip()}' are in the catalog"
+    unknown = len(card_quantities) - len(deck.quantities)
+    messages = [f"{unknown} cards of the code are not in the catalog, skipping..."] if unknown else []
+    return show_import_messages(deck, messages + save_imported_deck(deck))
+
+# Decks without any known card, or with the same cards as a stored one, are not saved, and the other stored decks
+# (not the one being overwritten) that are almost the same get a warning. Returns the messages, the last one says whether
+# the deck was imported. Empty decks are rejected first, or they would match any stored empty deck by their hash
+def save_imported_deck(deck: Deck) -> list[str]:
+    if not deck.quantities:
+        return [f"No known cards in deck '{deck.name}', not imported"]
+    identical_deck_id = call("identical_deck", cards=deck.card_quantities())
+    if identical_deck_id is not None:
+        return [f"Deck '{deck.name}' has the same cards as deck {identical_deck_id}, not imported"]
+    messages = [f"Warning: this deck is {100*similarity:.1f} % similar to deck {deck_id}"
+                for deck_id, similarity in call("near_duplicates", name=deck.name, cards=deck.card_quantities())]
+    save_deck(deck)
+    return messages + [f"Deck '{deck.name}' imported successfully!"]
+
+# Prints the messages of an import, and the deck once it is saved. Returns the last message as the menu notification
+def show_import_messages(deck: Deck, messages: list[str]) -> str:
+    for message in messages[:-1]:
+        print(message)
+    if deck.id is not None:
         generate_partial_deck_view(deck)
-        for skip in skipped:
-            print(skip)
-        return f"Deck '{deck_name}' imported successfully!"
+    return messages[-1]
 
 def edit_deck() -> str:
-    chosen_deck = input("Which deck do you want to edit?\n")
-    try:
-        id = int(chosen_deck)
-    except TypeError as e:        
-        id = int(repository.find_deck_id_by_name(chosen_deck))
-    deck = {"id": id}
-    deck["analysis"] = repository.get_deck_analysis_by_id(id)
+    chosen_deck = input("Which deck do you want to edit?\n").strip()
+    deck_id = call("resolve_deck", deck=chosen_deck)
+    if deck_id is None:
+        return f"Deck '{chosen_deck}' not found"
+    deck = {"id": deck_id}
+    deck["analysis"] = call("deck_stats", deck_id=deck_id)
     return edit_deck_menu(deck)
 
 def list_cards() -> str:
@@ -399,15 +397,10 @@ def list_cards() -> str:
     return "Returning to main menu"
 
 def list_all_cards() -> str:
-    with sqlite3.connect('cards.db') as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, name, type, region, effect, power, madness FROM cards;')
-        table = from_db_cursor(cursor)
-    print_card_table(table)
+    query_card_list_with_params(empty_card_filter_params())
 
-def filter_cards() -> str:
-    params = {
+def empty_card_filter_params() -> dict:
+    return {
         "name": "",
         "type": [],
         "region": [],
@@ -415,6 +408,9 @@ def filter_cards() -> str:
         "madness": [],
         "effect": ""
     }
+
+def filter_cards() -> str:
+    params = empty_card_filter_params()
     createMenu("What do you want to filter by?",
         {
             lambda param: f'name {"(" + param["name"] + ")" if param["name"] != "" else ""}': lambda param: set_str_param_for_list_query(param, "name"),
@@ -430,14 +426,6 @@ def set_str_param_for_list_query(params, param_type) -> str:
     params[param_type] = input(f"Enter the param_type or part of the param_type of the card")
     return f"Added {param_type} filter"
 
-def print_card_table(table: PrettyTable):
-    table.set_style(TableStyle.SINGLE_BORDER)
-    table._hrules = HRuleStyle.ALL
-    table._align = {"id": "r", "name": "l", "type": "l", "region": "l", "effect": "l", "madness": "r", "power": "r" }
-    table._max_width = {"effect": 50}
-    print(table)
-    input("Press Enter to continue\n")
-
 def add_filter_param_to_list(params: dict, param_type: str, reference_list: list[str]):
     print(f"Choose a {param_type} to search for:\n")
     for i, item in enumerate(reference_list):
@@ -485,48 +473,26 @@ def add_unique_to_array_as_copy(array: list, new_item):
         return copy
     return array
 
+def list_cards_table(params: dict) -> tuple[list[str], Iterable[tuple]]:
+    table = call("list_cards", params=params)
+    return table["columns"], table["rows"]
+
+# Small results are cached with their rendered pages, which are reused while the terminal width stays the same
 def query_card_list_with_params(params: dict) -> str:
-    with sqlite3.connect('cards.db') as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        query = 'SELECT id, name, type, region, effect, power, madness FROM cards'
-        if (params["name"] == "" and params["type"] == [] and params["region"] == [] and params["power"] == [] and params["madness"] == [] and params["effect"] == ""):
-            cursor.execute(query + ';')
-            table = from_db_cursor(cursor)
-            print_card_table(table)
-        else:
-            query += " WHERE "
-            conditions = []
-            values = []
-            if params["name"] != "":
-                conditions.append("lower(name) LIKE ?")
-                values.append("%" + params["name"].strip().lower() + "%")
-            if params["type"] != []:
-                conditions.append("type IN (" + ",".join(["?"]*len(params["type"])) + ")")
-                values.extend(params["type"])
-            if params["region"] != []:
-                conditions.append("region IN (" + ",".join(["?"]*len(params["region"])) + ")")
-                values.extend(params["region"])
-            if params["power"] != []:
-                for condition in params["power"]:
-                    conditions.append(f"power {condition['condition']} ?")
-                    values.append(condition['value'])
-            if params["madness"] != []:
-                for condition in params["madness"]:
-                    conditions.append(f"madness {condition['condition']} ?")
-                    values.append(condition['value'])
-            if params["effect"] != "":
-                conditions.append("lower(effect) LIKE ?")
-                values.append("%" + params["effect"].strip().lower() + "%")
-            query += " AND ".join(conditions) + ";"
-            cursor.execute(query, tuple(values))
-            table = from_db_cursor(cursor)
-            print_card_table(table)
-            #print(query)
-            #print(tuple(values))
+    import shutil
+    result = card_query_cache.get_or_compute((repository.FILTER_ENGINE,) + normalize_params(params), lambda: list_cards_table(params))
+    rendered_pages = result.pages_for_width(shutil.get_terminal_size().columns) if result.cached else None
+    page_through(PagedTable(result.rows, result.columns, repository.CARD_TABLE_ALIGN, repository.TABLE_MAX_WIDTH,
+                            rendered_pages=rendered_pages))
 
 def no_op():
     pass
 
 if __name__ == "__main__":
+    if "--profile" in sys.argv:
+        sys.argv.remove("--profile")
+        profiler.enable()
+    if len(sys.argv) > 1:
+        import cli
+        sys.exit(cli.run())
     create_main_menu()
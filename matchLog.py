@@ -0,0 +1,79 @@
+import atexit
+import sqlite3
+import time
+
+from database import get_connection, is_read_only
+
+RESULTS = ["win", "loss"]
+FLUSH_SIZE = 50
+FLUSH_SECONDS = 5.0
+
+# Matches of decks that were deleted before the flush are dropped
+INSERT_MATCH = '''
+    INSERT INTO matches (deck_id, opponent, result, played_at)
+    SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM decks WHERE id = ?)
+'''
+ROLLUP_MATCHUPS = '''
+    INSERT INTO matchup_stats (deck_id, opponent, wins, games)
+    SELECT deck_id, opponent, sum(result = 'win'), count(*) FROM matches
+    WHERE id > ?1 AND id <= ?2
+    GROUP BY deck_id, opponent
+    ON CONFLICT (deck_id, opponent) DO UPDATE SET wins = wins + excluded.wins, games = games + excluded.games
+'''
+ROLLUP_DECKS = '''
+    UPDATE decks SET wins = decks.wins + m.wins, games = decks.games + m.games
+    FROM (SELECT deck_id, sum(result = 'win') AS wins, count(*) AS games FROM matches
+          WHERE id > ?1 AND id <= ?2 GROUP BY deck_id) AS m
+    WHERE decks.id = m.deck_id
+'''
+
+# Adds the matches logged since the last rollup to matchup_stats and to the wins and games of decks.
+# Must run inside a transaction, so the log and the aggregates never disagree
+def rollup_matches(conn) -> int:
+    last_match_id = conn.execute('SELECT last_match_id FROM match_rollup').fetchone()[0]
+    newest_match_id = conn.execute('SELECT coalesce(max(id), 0) FROM matches').fetchone()[0]
+    if newest_match_id <= last_match_id:
+        return 0
+    conn.execute(ROLLUP_MATCHUPS, (last_match_id, newest_match_id))
+    conn.execute(ROLLUP_DECKS, (last_match_id, newest_match_id))
+    conn.execute('UPDATE match_rollup SET last_match_id = ?', (newest_match_id,))
+    return newest_match_id - last_match_id
+
+# Write-behind queue of match results: results are kept in memory and written (and rolled up) in one
+# transaction once FLUSH_SIZE of them are waiting or the oldest waited FLUSH_SECONDS, before any read
+# of the aggregates (see repository.py) and when the program exits
+class MatchLog:
+    def __init__(self, flush_size: int = FLUSH_SIZE, flush_seconds: float = FLUSH_SECONDS):
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.pending: list[tuple] = []
+        self._oldest = None
+
+    def record(self, deck_id: int, result: str, opponent: str = "") -> None:
+        if result not in RESULTS:
+            raise ValueError(f"Invalid result '{result}', expected one of {', '.join(RESULTS)}")
+        if not self.pending:
+            self._oldest = time.monotonic()
+        played_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        self.pending.append((deck_id, opponent.strip(), result, played_at, deck_id))
+        if len(self.pending) >= self.flush_size or time.monotonic() - self._oldest >= self.flush_seconds:
+            self.flush()
+
+    # Readers of the server cannot write, the writer flushes after every batch of writes instead
+    def flush(self) -> int:
+        if not self.pending or is_read_only():
+            return 0
+        pending, self.pending = self.pending, []
+        try:
+            with get_connection() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.executemany(INSERT_MATCH, pending)
+                rollup_matches(conn)
+        except sqlite3.Error:
+            # kept for the next flush
+            self.pending = pending + self.pending
+            raise
+        return len(pending)
+
+match_log = MatchLog()
+atexit.register(match_log.flush)
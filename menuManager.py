@@ -1,5 +1,46 @@
 from typing import Callable
 from traceback import print_exc
+from contextlib import redirect_stdout
+from io import StringIO
+
+import profiler
+
+# Introduction that is only computed again after mark_dirty() is called, otherwise the text it printed
+# and the prompt it returned the last time are reused. Use it for introductions that hit the database
+class CachedIntro:
+    def __init__(self, introduction: Callable):
+        self.introduction = introduction
+        self.dirty = True
+        self.printed = ""
+        self.intro_text = ""
+
+    def mark_dirty(self) -> None:
+        self.dirty = True
+
+    def __call__(self, *args) -> str:
+        if self.dirty:
+            output = StringIO()
+            with redirect_stdout(output):
+                self.intro_text = self.introduction(*args)
+            self.printed = output.getvalue()
+            self.dirty = False
+        print(self.printed, end="")
+        return self.intro_text
+
+# Wraps an option function so the cached introduction is recomputed after it runs
+def marks_dirty(intro: CachedIntro, option_func: Callable) -> Callable:
+    def option(*args):
+        try:
+            return option_func(*args)
+        finally:
+            intro.mark_dirty()
+    return option
+
+# Name used for an option in the profile report
+def option_label(option, option_func: Callable) -> str:
+    if isinstance(option, str):
+        return option
+    return getattr(option_func, "__qualname__", repr(option_func))
 
 # The function given to the options should return a string with an operation notification, or empty if you want the loop to break
 def createMenu(introduction: str | Callable, options: dict, prologue="", intro_arg=None, option_arg=None, option_func_arg=None):
@@ -21,12 +62,14 @@ def createMenu(introduction: str | Callable, options: dict, prologue="", intro_a
                 print(f"{i+1}. {option}")
         selection = input(prologue + "\n").strip()
         if selection in keys:
-            notification = options[selection]()
+            notification = profiler.time_action(option_label(selection, options[selection]), options[selection])
             loop = notification != None and notification != ""
         else:
             try:
                 int_sel = int(selection.strip())
-                notification = options[keys[int_sel-1]]() if option_func_arg is None else options[keys[int_sel-1]](option_func_arg)
+                option_func = options[keys[int_sel-1]]
+                label = option_label(keys[int_sel-1], option_func)
+                notification = profiler.time_action(label, option_func) if option_func_arg is None else profiler.time_action(label, option_func, option_func_arg)
                 loop = notification != None and notification != ""
             except Exception as e:
                 print_exc()
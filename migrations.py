@@ -0,0 +1,200 @@
+import sqlite3
+from itertools import groupby
+from typing import Callable
+
+# deck_stats helpers. The type and madness values are spelled out here (and not imported from cardCatalog)
+# so an already applied migration never changes
+_STATS_TYPES = ["creature", "event", "permanent"]
+_STATS_MADNESS = range(6)
+_STATS_COLUMNS = _STATS_TYPES + [f"mad_{madness}" for madness in _STATS_MADNESS]
+
+_RECOMPUTE_DECK_STATS = '''
+    INSERT OR REPLACE INTO deck_stats (deck_id, regions, region_counts, {columns}, card_count, win_rate)
+    SELECT d.id,
+        coalesce((SELECT group_concat(region) FROM (
+            SELECT DISTINCT c2.region FROM deck_cards dc2 INNER JOIN cards c2 ON c2.id = dc2.card_id
+            WHERE dc2.deck_id = d.id ORDER BY c2.region)), ''),
+        coalesce((SELECT json_group_object(region, quantity) FROM (
+            SELECT c2.region, sum(dc2.quantity) as quantity FROM deck_cards dc2 INNER JOIN cards c2 ON c2.id = dc2.card_id
+            WHERE dc2.deck_id = d.id GROUP BY c2.region ORDER BY c2.region)), '{{}}'),
+        {sums},
+        coalesce(sum(dc.quantity), 0),
+        CASE WHEN (d.games = 0) THEN 0 ELSE 100 * d.wins / d.games END
+    FROM decks d
+    LEFT JOIN deck_cards dc ON dc.deck_id = d.id
+    LEFT JOIN cards c ON c.id = dc.card_id
+    WHERE {condition}
+    GROUP BY d.id
+'''
+
+def _recompute_deck_stats(condition: str) -> str:
+    sums = [f"coalesce(sum(dc.quantity) FILTER (WHERE c.type = '{card_type}'), 0)" for card_type in _STATS_TYPES]
+    sums += [f"coalesce(sum(dc.quantity) FILTER (WHERE c.madness = {madness}), 0)" for madness in _STATS_MADNESS]
+    return _RECOMPUTE_DECK_STATS.format(columns=", ".join(_STATS_COLUMNS), sums=",\n        ".join(sums), condition=condition)
+
+# Adds (or subtracts, with sign "-") a single deck_cards row to its deck's stats, row is NEW or OLD inside a trigger
+def _apply_deck_card_to_stats(row: str, sign: str) -> str:
+    quantity = f"{row}.quantity"
+    region_path = "'$.\"' || c.region || '\"'"
+    deltas = [f"{card_type} = {card_type} {sign} iif(c.type = '{card_type}', {quantity}, 0)" for card_type in _STATS_TYPES]
+    deltas += [f"mad_{madness} = mad_{madness} {sign} iif(c.madness = {madness}, {quantity}, 0)" for madness in _STATS_MADNESS]
+    return f'''
+        UPDATE deck_stats SET
+            {", ".join(deltas)},
+            card_count = card_count {sign} {quantity},
+            region_counts = json_set(region_counts, {region_path}, coalesce(json_extract(region_counts, {region_path}), 0) {sign} {quantity})
+        FROM (SELECT type, region, madness FROM cards WHERE id = {row}.card_id) AS c
+        WHERE deck_id = {row}.deck_id;
+        UPDATE deck_stats SET
+            region_counts = (SELECT json_group_object(key, value) FROM (SELECT key, value FROM json_each(region_counts) WHERE value > 0 ORDER BY key)),
+            regions = coalesce((SELECT group_concat(key) FROM (SELECT key FROM json_each(region_counts) WHERE value > 0 ORDER BY key)), '')
+        WHERE deck_id = {row}.deck_id;
+    '''
+
+# Fills decks.content_hash (see deckCode.content_hash) for the decks stored before migration 6
+def _hash_existing_decks(conn: sqlite3.Connection) -> None:
+    from deckCode import content_hash
+    cursor = conn.execute('SELECT d.id, dc.card_id, dc.quantity FROM decks d LEFT JOIN deck_cards dc ON dc.deck_id = d.id ORDER BY d.id')
+    hashes = [(content_hash({card_id: quantity for _, card_id, quantity in rows if card_id is not None}), deck_id)
+              for deck_id, rows in groupby(cursor, key=lambda row: row[0])]
+    conn.executemany('UPDATE decks SET content_hash = ? WHERE id = ?', hashes)
+
+# Each migration is a list of statements, applied in order inside a single transaction. A statement is
+# SQL, or a function taking the connection for what SQL can't do.
+# The number of applied migrations is stored in PRAGMA user_version, so never edit or reorder
+# an existing migration, append a new one instead
+MIGRATIONS: list[list[str | Callable]] = [
+    # 1: indexes and constraints for deck and card lookups
+    [
+        # clean up data that would break the new constraints
+        'DELETE FROM deck_cards WHERE deck_id NOT IN (SELECT id FROM decks)',
+        '''UPDATE deck_cards SET quantity = (
+               SELECT sum(dc.quantity) FROM deck_cards dc
+               WHERE dc.deck_id = deck_cards.deck_id AND dc.card_id = deck_cards.card_id)
+           WHERE id IN (SELECT min(id) FROM deck_cards GROUP BY deck_id, card_id HAVING count(*) > 1)''',
+        'DELETE FROM deck_cards WHERE id NOT IN (SELECT min(id) FROM deck_cards GROUP BY deck_id, card_id)',
+        '''UPDATE decks SET name = name || ' (' || id || ')'
+           WHERE id NOT IN (SELECT min(id) FROM decks GROUP BY name COLLATE NOCASE)''',
+        # (deck_id, card_id) also serves every lookup by deck_id, so there's no separate deck_id index
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_deck_cards__deck_card ON deck_cards (deck_id, card_id)',
+        'CREATE INDEX IF NOT EXISTS ix_deck_cards__card ON deck_cards (card_id)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_cards__name ON cards (name COLLATE NOCASE)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_decks__name ON decks (name COLLATE NOCASE)',
+    ],
+    # 2: deck_stats, per deck aggregates kept up to date by triggers
+    [
+        f'''CREATE TABLE deck_stats (
+            deck_id INTEGER PRIMARY KEY REFERENCES decks (id) ON DELETE CASCADE,
+            regions TEXT NOT NULL DEFAULT '',
+            region_counts TEXT NOT NULL DEFAULT '{{}}',
+            {", ".join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in _STATS_COLUMNS)},
+            card_count INTEGER NOT NULL DEFAULT 0,
+            win_rate INTEGER NOT NULL DEFAULT 0)''',
+        _recompute_deck_stats("1 = 1"),
+        '''CREATE TRIGGER tr_decks__insert_stats AFTER INSERT ON decks BEGIN
+            INSERT OR IGNORE INTO deck_stats (deck_id) VALUES (NEW.id);
+        END''',
+        '''CREATE TRIGGER tr_decks__update_stats AFTER UPDATE OF wins, games ON decks BEGIN
+            UPDATE deck_stats SET win_rate = CASE WHEN (NEW.games = 0) THEN 0 ELSE 100 * NEW.wins / NEW.games END
+            WHERE deck_id = NEW.id;
+        END''',
+        '''CREATE TRIGGER tr_decks__delete_stats AFTER DELETE ON decks BEGIN
+            DELETE FROM deck_stats WHERE deck_id = OLD.id;
+        END''',
+        f'''CREATE TRIGGER tr_deck_cards__insert_stats AFTER INSERT ON deck_cards BEGIN
+            {_apply_deck_card_to_stats("NEW", "+")}
+        END''',
+        f'''CREATE TRIGGER tr_deck_cards__delete_stats AFTER DELETE ON deck_cards BEGIN
+            {_apply_deck_card_to_stats("OLD", "-")}
+        END''',
+        f'''CREATE TRIGGER tr_deck_cards__update_stats AFTER UPDATE OF deck_id, card_id, quantity ON deck_cards BEGIN
+            {_apply_deck_card_to_stats("OLD", "-")}
+            {_apply_deck_card_to_stats("NEW", "+")}
+        END''',
+        # changing a card's type, region or madness is rare, so the affected decks are simply recomputed
+        f'''CREATE TRIGGER tr_cards__update_stats AFTER UPDATE OF type, region, madness ON cards BEGIN
+            {_recompute_deck_stats("d.id IN (SELECT deck_id FROM deck_cards WHERE card_id = NEW.id)")};
+        END''',
+    ],
+    # 3: full text index over card names and effects, kept in sync with cards by triggers
+    [
+        '''CREATE VIRTUAL TABLE cards_fts USING fts5(
+            name, effect, content='cards', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3')''',
+        "INSERT INTO cards_fts (cards_fts) VALUES ('rebuild')",
+        '''CREATE TRIGGER tr_cards__insert_fts AFTER INSERT ON cards BEGIN
+            INSERT INTO cards_fts (rowid, name, effect) VALUES (NEW.id, NEW.name, NEW.effect);
+        END''',
+        '''CREATE TRIGGER tr_cards__delete_fts AFTER DELETE ON cards BEGIN
+            INSERT INTO cards_fts (cards_fts, rowid, name, effect) VALUES ('delete', OLD.id, OLD.name, OLD.effect);
+        END''',
+        '''CREATE TRIGGER tr_cards__update_fts AFTER UPDATE OF name, effect ON cards BEGIN
+            INSERT INTO cards_fts (cards_fts, rowid, name, effect) VALUES ('delete', OLD.id, OLD.name, OLD.effect);
+            INSERT INTO cards_fts (rowid, name, effect) VALUES (NEW.id, NEW.name, NEW.effect);
+        END''',
+    ],
+    # 4: catalog version, bumped on every write to cards so in-memory copies know when to reload
+    [
+        'CREATE TABLE catalog_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)',
+        'INSERT INTO catalog_version (id, version) VALUES (1, 1)',
+        '''CREATE TRIGGER tr_cards__insert_version AFTER INSERT ON cards BEGIN
+            UPDATE catalog_version SET version = version + 1;
+        END''',
+        '''CREATE TRIGGER tr_cards__update_version AFTER UPDATE ON cards BEGIN
+            UPDATE catalog_version SET version = version + 1;
+        END''',
+        '''CREATE TRIGGER tr_cards__delete_version AFTER DELETE ON cards BEGIN
+            UPDATE catalog_version SET version = version + 1;
+        END''',
+    ],
+    # 5: append-only match log. matchup_stats and the wins and games of decks are rollups of it, matches with
+    # an id above match_rollup.last_match_id are not rolled up yet
+    [
+        '''CREATE TABLE matches (
+            id INTEGER PRIMARY KEY,
+            deck_id INTEGER NOT NULL REFERENCES decks (id) ON DELETE CASCADE,
+            opponent TEXT NOT NULL DEFAULT '',
+            result TEXT NOT NULL CHECK (result IN ('win', 'loss')),
+            played_at TEXT NOT NULL)''',
+        'CREATE INDEX ix_matches__deck ON matches (deck_id)',
+        '''CREATE TABLE matchup_stats (
+            deck_id INTEGER NOT NULL REFERENCES decks (id) ON DELETE CASCADE,
+            opponent TEXT NOT NULL,
+            wins INTEGER NOT NULL DEFAULT 0,
+            games INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (deck_id, opponent)) WITHOUT ROWID''',
+        'CREATE TABLE match_rollup (id INTEGER PRIMARY KEY CHECK (id = 1), last_match_id INTEGER NOT NULL)',
+        'INSERT INTO match_rollup (id, last_match_id) VALUES (1, 0)',
+    ],
+    # 6: hash of the cards of every deck (see deckCode.content_hash), to find identical decks on import.
+    # Written by repository.write_deck, existing decks are hashed here
+    [
+        'ALTER TABLE decks ADD COLUMN content_hash TEXT',
+        'CREATE INDEX ix_decks__content_hash ON decks (content_hash)',
+        _hash_existing_decks,
+    ],
+]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn: sqlite3.Connection) -> int:
+    version = get_schema_version(conn)
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # another process may have migrated while we waited for the lock
+            if get_schema_version(conn) >= number:
+                conn.rollback()
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    return get_schema_version(conn)
@@ -0,0 +1,144 @@
+from collections import deque
+from itertools import islice
+from typing import Iterable
+
+PAGE_SIZE = 20
+# rows read ahead to compute the column widths, every page is rendered with the same widths
+SAMPLE_ROWS = 200
+# pages kept to go back to, older ones are dropped so memory does not grow with the result
+HISTORY_PAGES = 25
+
+# Pulls rows from a cursor (with fetchmany) or any other iterable of rows in chunks of page_size,
+# and renders one page at a time. Only the width sample, the current page and the page history are held in memory.
+# rendered_pages, when given, keeps the rendered pages by page number so a table shown again is not rendered again
+class PagedTable:
+    def __init__(self, rows: Iterable, columns: list[str], align: dict = None, max_width: dict = None,
+                 hidden: Iterable[str] = (), page_size: int = PAGE_SIZE, rendered_pages: dict[int, str] = None):
+        self.columns = list(columns)
+        self.visible = [i for i, column in enumerate(self.columns) if column not in hidden]
+        self.align = align or {}
+        self.page_size = page_size
+        self.rendered_pages = rendered_pages
+        self._fetchmany = rows.fetchmany if hasattr(rows, "fetchmany") else _chunks(iter(rows))
+        self._buffer = deque(self._fetchmany(SAMPLE_ROWS))
+        self.widths = column_widths(self.columns, self.visible, self._buffer, max_width or {})
+        self._history = deque(maxlen=HISTORY_PAGES)
+        self._forward = []
+        self.page = None
+        self.page_number = 0
+        self.exhausted = False
+
+    def _read(self, size: int) -> list:
+        rows = []
+        while self._buffer and len(rows) < size:
+            rows.append(self._buffer.popleft())
+        if len(rows) < size and not self.exhausted:
+            wanted = size - len(rows)
+            fetched = self._fetchmany(wanted)
+            rows += fetched
+            self.exhausted = len(fetched) < wanted
+        if not self._buffer and not self.exhausted:
+            # one row of look ahead, so has_next() is known without fetching a whole page
+            self._buffer.extend(self._fetchmany(1))
+            self.exhausted = not self._buffer
+        return rows
+
+    def has_next(self) -> bool:
+        return bool(self._forward) or bool(self._buffer) or not self.exhausted
+
+    def has_previous(self) -> bool:
+        return bool(self._history)
+
+    def next_page(self) -> list | None:
+        if not self.has_next():
+            return None
+        rows = self._forward.pop() if self._forward else self._read(self.page_size)
+        if not rows:
+            return None
+        if self.page is not None:
+            self._history.append(self.page)
+        self.page = rows
+        self.page_number += 1
+        return rows
+
+    def previous_page(self) -> list | None:
+        if not self._history:
+            return None
+        self._forward.append(self.page)
+        self.page = self._history.pop()
+        self.page_number -= 1
+        return self.page
+
+    # prettytable is imported here, so commands that never print a table do not pay for it
+    def render(self, rows: list) -> str:
+        from prettytable import PrettyTable, TableStyle, HRuleStyle
+        names = [self.columns[i] for i in self.visible]
+        table = PrettyTable(names)
+        table.set_style(TableStyle.SINGLE_BORDER)
+        table._hrules = HRuleStyle.ALL
+        table._align = {name: self.align.get(name, "l") for name in names}
+        table._min_width = dict(self.widths)
+        table._max_width = dict(self.widths)
+        table.add_rows([[row[i] for i in self.visible] for row in rows])
+        return table.get_string()
+
+    def render_page(self) -> str:
+        if self.rendered_pages is None:
+            return self.render(self.page)
+        if self.page_number not in self.rendered_pages:
+            self.rendered_pages[self.page_number] = self.render(self.page)
+        return self.rendered_pages[self.page_number]
+
+    # Prints every page (or the first max_pages) as one continuous table, for output that is not browsed.
+    # Every page is rendered with the same widths, so the pages are joined by dropping the header of the
+    # following pages (their header separator is the separator between the rows) and the bottom border of the previous one
+    def print_all(self, max_pages: int = None) -> int:
+        count = 0
+        lines = None
+        while (max_pages is None or self.page_number < max_pages) and (rows := self.next_page()) is not None:
+            if lines is not None:
+                print("\n".join(lines[:-1]))
+            lines = self.render(rows).splitlines()
+            if count > 0:
+                lines = lines[_header_end(lines):]
+            count += len(rows)
+            self._history.clear()
+        if lines is not None:
+            print("\n".join(lines))
+        return count
+
+# Index of the line under the header, the first separator that is not the top border
+def _header_end(lines: list[str]) -> int:
+    return next(i for i, line in enumerate(lines) if line.startswith("├"))
+
+def _chunks(rows):
+    return lambda size: list(islice(rows, size))
+
+# Width of each visible column: the longest value in the sample (or the header), capped by max_width
+def column_widths(columns: list[str], visible: list[int], sample: Iterable, max_width: dict) -> dict[str, int]:
+    widths = {columns[i]: len(columns[i]) for i in visible}
+    for row in sample:
+        for i in visible:
+            widths[columns[i]] = max(widths[columns[i]], len(str(row[i])))
+    return {column: min(width, max_width.get(column, width)) for column, width in widths.items()}
+
+# Shows the table one page at a time: Enter or n for the next page, p for the previous one, q to stop
+def page_through(table: PagedTable) -> None:
+    rows = table.next_page()
+    if rows is None:
+        print(table.render([]))
+        input("Press Enter to continue\n")
+        return
+    while True:
+        print(table.render_page())
+        if not table.has_next() and not table.has_previous():
+            input("Press Enter to continue\n")
+            return
+        options = (["[n]ext"] if table.has_next() else []) + (["[p]revious"] if table.has_previous() else []) + ["[q]uit"]
+        selection = input(f"Page {table.page_number}. {', '.join(options)}\n").strip().lower()
+        if selection in ("", "n") and table.has_next():
+            table.next_page()
+        elif selection == "p" and table.has_previous():
+            table.previous_page()
+        elif selection in ("", "q"):
+            return
@@ -0,0 +1,172 @@
+import atexit
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import Callable
+
+PROFILE_ENV_VAR = "SANITYS_END_PROFILE"
+PROGRESS_HANDLER_STEPS = 1000
+REPORT_TOP = 10
+EXPLAIN_TOP = 3
+EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+enabled = os.environ.get(PROFILE_ENV_VAR, "") not in ("", "0")
+
+# normalized sql -> {"count", "seconds", "vm_steps", "traced", "sql", "parameters"}
+statements: dict[str, dict] = {}
+# action label -> {"count", "seconds", "statements"}
+actions: dict[str, dict] = {}
+_statements_run = 0
+# the server's reader threads record their statements at the same time
+_lock = threading.Lock()
+_report_registered = False
+
+def normalize_sql(sql: str) -> str:
+    return re.sub(r"\s+", " ", sql).strip()
+
+def _statement_stats(sql: str) -> dict:
+    key = normalize_sql(sql)
+    stats = statements.get(key)
+    if stats is None:
+        stats = statements[key] = {"count": 0, "seconds": 0.0, "vm_steps": 0, "traced": 0, "sql": sql, "parameters": ()}
+    return stats
+
+# Times execute, executemany and every fetch, so statements that are stepped lazily are fully accounted for
+class ProfiledCursor(sqlite3.Cursor):
+    def _timed(self, sql: str, parameters, run: Callable):
+        global _statements_run
+        with _lock:
+            stats = _statement_stats(sql)
+            stats["count"] += 1
+            stats["parameters"] = parameters
+            _statements_run += 1
+        self._stats = stats
+        self.connection.current_statement = stats
+        start = time.perf_counter()
+        try:
+            return run()
+        finally:
+            _add_seconds(stats, time.perf_counter() - start)
+
+    def execute(self, sql, parameters=()):
+        return self._timed(sql, parameters, lambda: super(ProfiledCursor, self).execute(sql, parameters))
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        first = seq_of_parameters[0] if seq_of_parameters else ()
+        return self._timed(sql, first, lambda: super(ProfiledCursor, self).executemany(sql, seq_of_parameters))
+
+    def _fetch(self, fetch: Callable):
+        stats = getattr(self, "_stats", None)
+        if stats is None:
+            return fetch()
+        self.connection.current_statement = stats
+        start = time.perf_counter()
+        try:
+            return fetch()
+        finally:
+            _add_seconds(stats, time.perf_counter() - start)
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(lambda: super(ProfiledCursor, self).fetchmany(self.arraysize if size is None else size))
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+    def __next__(self):
+        return self._fetch(super().__next__)
+
+def _add_seconds(stats: dict, seconds: float) -> None:
+    with _lock:
+        stats["seconds"] += seconds
+
+# The statement being run is kept per connection, so the hooks of each connection count for its own statements
+class ProfiledConnection(sqlite3.Connection):
+    current_statement: dict | None = None
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+# Counts every statement SQLite runs (trigger bodies included) and the VM steps spent on the current one
+def install_hooks(conn: ProfiledConnection) -> None:
+    def trace(sql: str) -> None:
+        if conn.current_statement is not None:
+            conn.current_statement["traced"] += 1
+
+    def progress() -> int:
+        if conn.current_statement is not None:
+            conn.current_statement["vm_steps"] += PROGRESS_HANDLER_STEPS
+        return 0
+
+    conn.set_trace_callback(trace)
+    conn.set_progress_handler(progress, PROGRESS_HANDLER_STEPS)
+
+def enable() -> None:
+    global enabled, _report_registered
+    enabled = True
+    if not _report_registered:
+        atexit.register(print_report)
+        _report_registered = True
+
+def time_action(label: str, func: Callable, *args):
+    if not enabled:
+        return func(*args)
+    stats = actions.setdefault(label, {"count": 0, "seconds": 0.0, "statements": 0})
+    statements_before = _statements_run
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        stats["count"] += 1
+        stats["seconds"] += time.perf_counter() - start
+        stats["statements"] += _statements_run - statements_before
+
+def explain(db_file_name: str, stats: dict) -> list[str]:
+    try:
+        with sqlite3.connect(db_file_name) as conn:
+            rows = conn.execute("EXPLAIN QUERY PLAN " + stats["sql"], stats["parameters"]).fetchall()
+        return [f"{'  ' * (depth_of(rows, row) + 1)}{row[3]}" for row in rows]
+    except sqlite3.Error as e:
+        return [f"  (no plan: {e})"]
+
+def depth_of(rows: list, row: tuple) -> int:
+    parents = {plan_row[0]: plan_row[1] for plan_row in rows}
+    depth = 0
+    parent = row[1]
+    while parent in parents:
+        depth += 1
+        parent = parents[parent]
+    return depth
+
+def print_report(out=sys.stderr) -> None:
+    import database
+    if not statements and not actions:
+        return
+    print("\n==== Profile report ====", file=out)
+    print(f"\nSlowest actions (of {len(actions)}):", file=out)
+    for label, stats in sorted(actions.items(), key=lambda item: -item[1]["seconds"])[:REPORT_TOP]:
+        print(f"{1000*stats['seconds']:10.2f} ms  {stats['count']:6}x  {stats['statements']:7} statements  {label}", file=out)
+    ranked = sorted(statements.values(), key=lambda stats: -stats["seconds"])
+    print(f"\nSlowest statements (of {len(ranked)}):", file=out)
+    for stats in ranked[:REPORT_TOP]:
+        print(f"{1000*stats['seconds']:10.2f} ms  {stats['count']:6}x  {1000*stats['seconds']/stats['count']:8.3f} ms/call  "
+              f"{stats['vm_steps']:>10} vm steps  {stats['traced']:6} traced  {normalize_sql(stats['sql'])[:120]}", file=out)
+    for stats in [stats for stats in ranked if EXPLAINABLE.match(stats["sql"])][:EXPLAIN_TOP]:
+        print(f"\nEXPLAIN QUERY PLAN {normalize_sql(stats['sql'])[:120]}", file=out)
+        for line in explain(database.DB_FILE_NAME, stats):
+            print(line, file=out)
+
+if enabled:
+    enable()
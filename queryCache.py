@@ -0,0 +1,86 @@
+from collections import OrderedDict
+from itertools import chain, islice
+from typing import Callable, Iterable
+
+from cardCatalog import card_catalog
+
+DEFAULT_MAX_ENTRIES = 64
+DEFAULT_MAX_ROWS = 50000
+# longer results are streamed from the query every time instead of being cached
+DEFAULT_MAX_RESULT_ROWS = 2000
+
+# Turns a filter_cards params dict into a hashable key, so the same filters typed in another order
+# (or with different spacing and casing) share a cache entry
+def normalize_params(params: dict) -> tuple:
+    return (
+        params["name"].strip().lower(),
+        params["effect"].strip().lower(),
+        tuple(sorted(set(params["type"]))),
+        tuple(sorted(set(params["region"]))),
+        tuple(sorted({(condition["condition"], condition["value"]) for condition in params["power"]})),
+        tuple(sorted({(condition["condition"], condition["value"]) for condition in params["madness"]})),
+    )
+
+class CachedResult:
+    __slots__ = ("columns", "rows", "cached", "rendered_width", "rendered_pages")
+
+    # rows is a list when the result is cached, otherwise an iterator that can only be read once
+    def __init__(self, columns: list[str], rows: Iterable[tuple], cached: bool = True):
+        self.columns = columns
+        self.rows = rows
+        self.cached = cached
+        self.rendered_width = None
+        self.rendered_pages: dict[int, str] = {}
+
+    # Rendered pages by page number, dropped when the terminal width changes
+    def pages_for_width(self, width: int) -> dict[int, str]:
+        if width != self.rendered_width:
+            self.rendered_pages = {}
+            self.rendered_width = width
+        return self.rendered_pages
+
+# LRU cache of card query results, limited by entries and by the total number of cached rows.
+# Everything is dropped when the catalog version changes (any write to cards)
+class QueryCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_rows: int = DEFAULT_MAX_ROWS,
+                 max_result_rows: int = DEFAULT_MAX_RESULT_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.max_result_rows = max_result_rows
+        self.entries: OrderedDict[tuple, CachedResult] = OrderedDict()
+        self.cached_rows = 0
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.cached_rows = 0
+
+    # compute returns the columns and an iterable of rows (a cursor). Only the first max_result_rows + 1 rows are read
+    # here: a longer result is returned uncached, with rows that go on reading from the cursor as they are consumed
+    def get_or_compute(self, key: tuple, compute: Callable[[], tuple[list[str], Iterable[tuple]]]) -> CachedResult:
+        version = card_catalog.current_version()
+        if version != self.version:
+            self.clear()
+            self.version = version
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return result
+        self.misses += 1
+        columns, rows = compute()
+        rows = iter(rows)
+        head = list(islice(rows, self.max_result_rows + 1))
+        if len(head) > self.max_result_rows:
+            return CachedResult(columns, chain(head, rows), cached=False)
+        result = CachedResult(columns, head)
+        self.entries[key] = result
+        self.cached_rows += len(head)
+        while len(self.entries) > self.max_entries or self.cached_rows > self.max_rows:
+            _, evicted = self.entries.popitem(last=False)
+            self.cached_rows -= len(evicted.rows)
+        return result
+
+card_query_cache = QueryCache()
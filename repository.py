@@ -1,48 +1,54 @@
-import sqlite3
-from prettytable import from_db_cursor, TableStyle, HRuleStyle, PrettyTable
+# deckSimilarity is imported by the functions that write decks, it is not needed to start the menu
+import json
+import os
+import re
+from typing import Iterable
 
-DB_FILE_NAME = 'cards.db'
-CARD_TYPES = ["creature", "event", "permanent"]
+from database import get_connection
+from pagedTable import PagedTable, page_through
+from matchLog import match_log
+from cardCatalog import CARD_TYPES, REGIONS, MADNESS_VALUES
+from deckCode import content_hash, encode_deck_code
 
-def print_all_decks():
-    with sqlite3.connect(DB_FILE_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-                       SELECT d.id, d.name, group_concat(distinct c.region) as regions, sum(dc.quantity) as card_count, 
-                       CASE WHEN (d.games = 0) THEN 0 ELSE 100 * d.wins / d.games END as win_rate, d.games
-                       FROM decks d
-                       INNER JOIN deck_cards dc on dc.deck_id = d.id
-                       INNER JOIN cards c on c.id = dc.card_id
-                       GROUP BY d.id
-                       ''')
-        table = from_db_cursor(cursor)
-        print_deck_table(table)
-        
-def print_card_table(table: PrettyTable):
-    table.set_style(TableStyle.SINGLE_BORDER)
-    table._hrules = HRuleStyle.ALL
-    table._align = {"id": "r", "name": "l", "type": "l", "region": "l", "effect": "l", "madness": "r", "power": "r"}
-    table._max_width = {"effect": 50}
-    print(table)
-    input("Press Enter to continue\n")
-
-def print_deck_table(table: PrettyTable):
-    table.set_style(TableStyle.SINGLE_BORDER)
-    table._hrules = HRuleStyle.ALL
-    table._align = {"id": "r", "name": "l", "regions": "l", "card_count": "r", "win_rate": "r", "games": "r"}
-    table._max_width = {"effect": 50}
-    print(table)
-    input("Press Enter to continue\n")
-
-def find_deck_id_by_name(deck_name):
-    with sqlite3.connect(DB_FILE_NAME) as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute('''
-                       SELECT id FROM decks
-                       WHERE d.name = ?
-                       ''', (deck_name,))
-        return cursor.fetchone()["id"]
+ALL_DECKS_QUERY = '''
+    SELECT d.id, d.name, s.regions, s.card_count, s.win_rate, d.games
+    FROM decks d
+    INNER JOIN deck_stats s ON s.deck_id = d.id
+    ORDER BY d.id
+'''
+
+TABLE_MAX_WIDTH = {"effect": 50}
+CARD_TABLE_ALIGN = {"id": "r", "name": "l", "type": "l", "region": "l", "effect": "l", "madness": "r", "power": "r"}
+DECK_TABLE_ALIGN = {"id": "r", "name": "l", "regions": "l", "card_count": "r", "win_rate": "r", "games": "r"}
+CARDS_IN_DECK_TABLE_ALIGN = {"quantity": "r", "name": "l", "type": "l", "region": "l", "effect": "l", "madness": "r", "power": "r"}
+
+# Returns a cursor over the deck list, for callers that stream the rows instead of printing a table
+def iter_all_decks():
+    match_log.flush()
+    return get_connection().execute(ALL_DECKS_QUERY)
+
+# Tables are the {"columns": [...], "rows": iterable} returned by the deck server operations (see deckServer.py),
+# rendered a page at a time as the rows are read (see pagedTable.py): browsed when pausing, otherwise printed as one table.
+# max_pages limits what is printed when not pausing, returns False if rows were left out
+def print_paged_table(table: dict, align: dict, pause: bool = True, max_pages: int = None, hidden=()) -> bool:
+    paged_table = PagedTable(table["rows"], table["columns"], align, TABLE_MAX_WIDTH, hidden)
+    if pause:
+        page_through(paged_table)
+        return True
+    paged_table.print_all(max_pages)
+    return not paged_table.has_next()
+
+def print_deck_table(table: dict, pause: bool = True, max_pages: int = None) -> bool:
+    return print_paged_table(table, DECK_TABLE_ALIGN, pause, max_pages)
+
+# Accepts a deck id or a deck name, returns None if there's no such deck
+def resolve_deck_id(deck: str | int) -> int | None:
+    conn = get_connection()
+    try:
+        deck_id = int(deck)
+    except ValueError:
+        return find_deck_id(conn, deck)
+    return deck_id if conn.execute('SELECT 1 FROM decks WHERE id = ?', (deck_id,)).fetchone() else None
 
 CARDS_FROM_DECK_QUERY = '''
     SELECT c.id, dc.quantity, c.name, c.type, c.region, c.effect, c.power, c.madness 
@@ -51,71 +57,45 @@ CARDS_FROM_DECK_QUERY = '''
     WHERE dc.deck_id = ?
 '''
 
-def print_deck_cards_by_id(deck_id):
-    with sqlite3.connect(DB_FILE_NAME) as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute(CARDS_FROM_DECK_QUERY, (deck_id,))
-        table = from_db_cursor(cursor)
-    table.del_column("id")
-    print_cards_in_deck_table(table)
-
 def get_cards_for_deck_id(deck_id) -> list:
-    with sqlite3.connect(DB_FILE_NAME) as conn:
-        conn.row_factory = sqlite3.Row
+    with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(CARDS_FROM_DECK_QUERY, (deck_id,))
         return cursor.fetchall()
 
-def print_cards_in_deck_table(table: PrettyTable):
-    table.set_style(TableStyle.SINGLE_BORDER)
-    table._hrules = HRuleStyle.ALL
-    table._align = {"quantity": "r", "name": "l", "type": "l", "region": "l", "effect": "l", "madness": "r", "power": "r"}
-    table._max_width = {"effect": 50}
-    print(table)
-    input("Press Enter to continue\n")
-
-def get_deck_analysis_by_id(deck_id: int):
-    with sqlite3.connect(DB_FILE_NAME) as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute('''
-                       SELECT distinct(c.region) as region
-                       FROM decks d
-                       INNER JOIN deck_cards dc ON dc.deck_id = d.id
-                       INNER JOIN cards c ON c.id = dc.card_id
-                       WHERE d.id = ?
-                       ''', (deck_id,))
-        regions_dict = cursor.fetchall()
-        regions: list[str] = []
-        region_query = ""
-        for region_dict in regions_dict:
-            regions.append(region_dict["region"])
-        for region in regions:
-            region_query += f"sum(dc.quantity) FILTER (WHERE c.region = '{region}') as \"{region}\","
-        type_query = ""
-        for card_type in CARD_TYPES:
-            type_query += f"sum(dc.quantity) FILTER (WHERE c.type = '{card_type}') as {card_type},"
-        madness_query = ""
-        for i in range(6):
-            madness_query += f"sum(dc.quantity) FILTER (WHERE c.madness = '{i}') as mad_{i},"
-        cursor.execute(f'''
-                       SELECT d.wins, d.games, d.name,
-                       {region_query}
-                       {type_query}
-                       {madness_query}
-                       sum(dc.quantity) as total
-                       FROM decks d
-                       INNER JOIN deck_cards dc ON dc.deck_id = d.id
-                       INNER JOIN cards c ON c.id = dc.card_id
-                       WHERE d.id = ?
-                       GROUP BY d.id;
-                       ''', (deck_id,))
-        return {"stats": cursor.fetchone(),
-                "regions": regions}
+def print_cards_in_deck_table(table: dict, pause: bool = True) -> bool:
+    return print_paged_table(table, CARDS_IN_DECK_TABLE_ALIGN, pause, hidden=("id",))
+
+DECK_ANALYSIS_QUERY = '''
+    SELECT d.id, d.name, d.wins, d.games, s.*
+    FROM decks d
+    INNER JOIN deck_stats s ON s.deck_id = d.id
+    WHERE d.id IN (SELECT value FROM json_each(?))
+'''
+
+# Reads the precomputed deck_stats rows (kept up to date by triggers) of many decks in one query.
+# Returns {deck id: {"stats": {...}, "regions": [...]}}, decks that don't exist are left out
+def get_deck_analyses_by_ids(deck_ids: list[int]) -> dict[int, dict]:
+    analyses: dict[int, dict] = {}
+    match_log.flush()
+    with get_connection() as conn:
+        for row in conn.execute(DECK_ANALYSIS_QUERY, (json.dumps(list(deck_ids)),)):
+            stats = {"name": row["name"], "wins": row["wins"], "games": row["games"], "total": row["card_count"]}
+            for card_type in CARD_TYPES:
+                stats[card_type] = row[card_type]
+            for madness in MADNESS_VALUES:
+                stats[f"mad_{madness}"] = row[f"mad_{madness}"]
+            region_counts = json.loads(row["region_counts"])
+            stats.update(region_counts)
+            regions = sorted(region_counts, key=lambda region: REGIONS.index(region) if region in REGIONS else len(REGIONS))
+            analyses[row["id"]] = {"stats": stats, "regions": regions}
+    return analyses
+
+def get_deck_analysis_by_id(deck_id: int) -> dict | None:
+    return get_deck_analyses_by_ids([deck_id]).get(deck_id)
 
 def delete_deck_by_id(deck_id):
-    with sqlite3.connect(DB_FILE_NAME) as conn:
+    with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
                        DELETE FROM deck_cards
@@ -126,15 +106,145 @@ def delete_deck_by_id(deck_id):
                        WHERE id = ?
                        ''', (deck_id,))
         conn.commit()
+    from deckSimilarity import deck_index
+    deck_index.remove(deck_id)
 
-def register_win_for_deck(deck_id):
-    with sqlite3.connect(DB_FILE_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("UPDATE decks SET wins = wins+1, games = games+1 WHERE id = ?", (deck_id,))
-        conn.commit()
+# Results go through the match log (see matchLog.py), the wins and games of the deck are updated when it flushes
+def register_win_for_deck(deck_id, opponent: str = ""):
+    match_log.record(deck_id, "win", opponent)
+
+def register_loss_for_deck(deck_id, opponent: str = ""):
+    match_log.record(deck_id, "loss", opponent)
+
+MATCHUPS_QUERY = '''
+    SELECT opponent, wins, games, 100 * wins / games AS win_rate
+    FROM matchup_stats
+    WHERE deck_id = ? AND games > 0
+    ORDER BY games DESC, opponent
+'''
+
+def get_matchups_for_deck_id(deck_id) -> list:
+    match_log.flush()
+    return get_connection().execute(MATCHUPS_QUERY, (deck_id,)).fetchall()
+
+def find_deck_id(conn, deck_name):
+    row = conn.execute('SELECT id FROM decks WHERE name = ? COLLATE NOCASE LIMIT 1', (deck_name,)).fetchone()
+    return row["id"] if row else None
+
+# Id of a stored deck with exactly these cards (see deckCode.content_hash), None if there's none
+def find_deck_id_by_content_hash(conn, card_hash: str) -> int | None:
+    row = conn.execute('SELECT id FROM decks WHERE content_hash = ? ORDER BY id LIMIT 1', (card_hash,)).fetchone()
+    return row["id"] if row else None
+
+def find_identical_deck_id(card_quantities: dict[int, int]) -> int | None:
+    return find_deck_id_by_content_hash(get_connection(), content_hash(card_quantities))
+
+def get_deck_code(deck_id) -> str:
+    return encode_deck_code(get_deck_card_quantities(get_connection(), deck_id))
+
+def get_deck_card_quantities(conn, deck_id) -> dict[int, int]:
+    cursor = conn.execute('SELECT card_id, quantity FROM deck_cards WHERE deck_id = ?', (deck_id,))
+    return {card_id: quantity for card_id, quantity in cursor}
+
+# Returns the rows to insert, the quantities to update and the rows to delete to go from stored to wanted
+def diff_deck_cards(deck_id, stored: dict[int, int], wanted: dict[int, int]) -> tuple[list, list, list]:
+    inserts = []
+    updates = []
+    deletes = []
+    for card_id, quantity in wanted.items():
+        if quantity <= 0:
+            continue
+        stored_quantity = stored.get(card_id)
+        if stored_quantity is None:
+            inserts.append((deck_id, card_id, quantity))
+        elif stored_quantity != quantity:
+            updates.append((quantity, deck_id, card_id))
+    for card_id in stored:
+        if wanted.get(card_id, 0) <= 0:
+            deletes.append((deck_id, card_id))
+    return inserts, updates, deletes
+
+# Writes the deck without managing the transaction, so callers can batch several decks in one
+def write_deck(conn, deck_name: str, card_quantities: dict[int, int], card_hash: str = None) -> int:
+    card_hash = card_hash or content_hash(card_quantities)
+    deck_id = find_deck_id(conn, deck_name)
+    if deck_id is None:
+        deck_id = conn.execute('INSERT INTO decks (name, content_hash) VALUES (?, ?) RETURNING id', (deck_name, card_hash)).fetchone()["id"]
+        stored = {}
+    else:
+        conn.execute('UPDATE decks SET content_hash = ? WHERE id = ? AND content_hash IS NOT ?', (card_hash, deck_id, card_hash))
+        stored = get_deck_card_quantities(conn, deck_id)
+    inserts, updates, deletes = diff_deck_cards(deck_id, stored, card_quantities)
+    if deletes:
+        conn.executemany('DELETE FROM deck_cards WHERE deck_id = ? AND card_id = ?', deletes)
+    if updates:
+        conn.executemany('UPDATE deck_cards SET quantity = ? WHERE deck_id = ? AND card_id = ?', updates)
+    if inserts:
+        conn.executemany('INSERT INTO deck_cards (deck_id, card_id, quantity) VALUES (?, ?, ?)', inserts)
+    return deck_id
+
+def save_deck(deck_name: str, card_quantities: dict[int, int]) -> int:
+    with get_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        deck_id = write_deck(conn, deck_name, card_quantities)
+    from deckSimilarity import deck_index
+    deck_index.update(deck_id, card_quantities)
+    return deck_id
+
+# "sqlite" runs the filters as SQL (with full text search), "memory" answers them from the in-memory
+# columnar card store, matching name and effect as plain substrings
+FILTER_ENGINE = os.environ.get("SANITYS_END_FILTER_ENGINE", "sqlite")
+
+# Name matches weigh more than effect matches when ranking the text search results
+TEXT_SEARCH_WEIGHTS = {"name": 10.0, "effect": 1.0}
+
+# Turns the typed text into an FTS5 expression where every word is a prefix that must be present,
+# e.g. 'draw car' -> name : ("draw"* AND "car"*). Returns "" if there are no words to search for
+def text_search_expression(column: str, text: str) -> str:
+    words = re.findall(r"\w+", text.lower())
+    if words == []:
+        return ""
+    return f'{column} : (' + " AND ".join(f'"{word}"*' for word in words) + ')'
 
-def register_loss_for_deck(deck_id):
-    with sqlite3.connect(DB_FILE_NAME) as conn:
+# Returns the column names and the rows of the cards matching the filter params, as they are read from the query
+def search_cards(params: dict) -> tuple[list[str], Iterable[tuple]]:
+    if FILTER_ENGINE == "memory":
+        from cardStore import get_card_store, CARD_COLUMNS
+        return CARD_COLUMNS, [tuple(card[column] for column in CARD_COLUMNS) for card in get_card_store().search(params)]
+    with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("UPDATE decks SET games = games+1 WHERE id = ?", (deck_id,))
-        conn.commit()
\ No newline at end of file
+        query = 'SELECT c.id, c.name, c.type, c.region, c.effect, c.power, c.madness FROM cards c'
+        conditions = []
+        values = []
+        text_searches = []
+        for column in TEXT_SEARCH_WEIGHTS:
+            if params[column].strip() == "":
+                continue
+            expression = text_search_expression(column, params[column])
+            if expression != "":
+                text_searches.append(expression)
+            else:
+                conditions.append(f"lower(c.{column}) LIKE ?")
+                values.append("%" + params[column].strip().lower() + "%")
+        if text_searches != []:
+            query += " INNER JOIN cards_fts ON cards_fts.rowid = c.id"
+            conditions.append("cards_fts MATCH ?")
+            values.append(" AND ".join(text_searches))
+        if params["type"] != []:
+            conditions.append("c.type IN (" + ",".join(["?"]*len(params["type"])) + ")")
+            values.extend(params["type"])
+        if params["region"] != []:
+            conditions.append("c.region IN (" + ",".join(["?"]*len(params["region"])) + ")")
+            values.extend(params["region"])
+        for condition in params["power"]:
+            conditions.append(f"c.power {condition['condition']} ?")
+            values.append(condition['value'])
+        for condition in params["madness"]:
+            conditions.append(f"c.madness {condition['condition']} ?")
+            values.append(condition['value'])
+        if conditions != []:
+            query += " WHERE " + " AND ".join(conditions)
+        if text_searches != []:
+            query += " ORDER BY bm25(cards_fts, " + ", ".join(str(weight) for weight in TEXT_SEARCH_WEIGHTS.values()) + ")"
+        cursor.execute(query + ";", tuple(values))
+        return [column[0] for column in cursor.description], (tuple(row) for row in cursor)
@@ -0,0 +1,48 @@
+import os
+import unittest
+
+import bulkImport
+import database
+import repository
+from cardCatalog import card_catalog
+from databaseTestCase import DatabaseTestCase
+
+class BulkImportTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cards = card_catalog.refresh().all_cards()[:3]
+
+    def write_deck_file(self, file_name: str, cards: list[dict]) -> str:
+        path = os.path.join(self.folder, "decks", file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file:
+            file.writelines(f"1 {card['name']}\n" for card in cards)
+        return path
+
+    def test_files_with_the_same_deck_name_do_not_overwrite_each_other(self):
+        self.write_deck_file("Aggro.txt", self.cards[:1])
+        lower_case_file = self.write_deck_file("aggro.txt", self.cards[1:2])
+        other_folder_file = self.write_deck_file(os.path.join("more", "Aggro.txt"), self.cards[2:3])
+        report = bulkImport.import_decks(os.path.join(self.folder, "decks"), workers=1)
+        self.assertEqual(report["decks"], 3)
+        self.assertEqual(report["renamed"], {lower_case_file: "aggro (2)", other_folder_file: "Aggro (3)"})
+        conn = database.get_connection()
+        for deck_name, card in (("Aggro", self.cards[0]), ("aggro (2)", self.cards[1]), ("Aggro (3)", self.cards[2])):
+            deck_id = repository.find_deck_id(conn, deck_name)
+            self.assertEqual(repository.get_deck_card_quantities(conn, deck_id), {card["id"]: 1})
+
+    def test_importing_again_updates_the_same_decks(self):
+        self.write_deck_file("Aggro.txt", self.cards[:1])
+        changed_file = self.write_deck_file("aggro.txt", self.cards[1:2])
+        bulkImport.import_decks(os.path.join(self.folder, "decks"), workers=1)
+        self.write_deck_file("aggro.txt", self.cards[1:3])
+        report = bulkImport.import_decks(os.path.join(self.folder, "decks"), workers=1)
+        self.assertEqual(report["decks"], 1)
+        self.assertEqual(report["renamed"], {changed_file: "aggro (2)"})
+        conn = database.get_connection()
+        self.assertEqual(repository.get_deck_card_quantities(conn, repository.find_deck_id(conn, "aggro (2)")),
+                         {card["id"]: 1 for card in self.cards[1:3]})
+        self.assertIsNone(repository.find_deck_id(conn, "aggro (3)"))
+
+if __name__ == "__main__":
+    unittest.main()
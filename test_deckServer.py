@@ -0,0 +1,82 @@
+import contextlib
+import io
+import os
+import unittest
+
+import cli
+import database
+import deckServer
+import main
+import repository
+from cardCatalog import card_catalog
+from databaseTestCase import DatabaseTestCase
+from deck import MAX_COPIES
+from deckCode import encode_deck_code
+
+UNKNOWN_CARD_ID = 10 ** 6
+
+class ImportCodeTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.card_id = card_catalog.refresh().all_cards()[0]["id"]
+
+    def test_code_with_only_unknown_cards_is_rejected(self):
+        with self.assertRaises(ValueError):
+            deckServer.op_import_code("Unknown cards", encode_deck_code({UNKNOWN_CARD_ID: 1}))
+        self.assertIsNone(repository.resolve_deck_id("Unknown cards"))
+
+    def test_code_without_cards_is_rejected(self):
+        with self.assertRaises(ValueError):
+            deckServer.op_import_code("No cards", encode_deck_code({}))
+        self.assertIsNone(repository.resolve_deck_id("No cards"))
+
+    def test_cli_reports_unknown_cards_without_a_traceback(self):
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr), self.assertRaises(SystemExit) as exit:
+            cli.run(["import-code", encode_deck_code({UNKNOWN_CARD_ID: 1}), "Unknown cards"])
+        self.assertEqual(exit.exception.code, 2)
+        self.assertIn("are in the catalog", stderr.getvalue())
+
+    def test_unknown_cards_are_left_out(self):
+        result = deckServer.op_import_code("Some unknown cards", encode_deck_code({self.card_id: 1, UNKNOWN_CARD_ID: 1}))
+        self.assertTrue(result["imported"])
+        self.assertEqual(result["unknown_cards"], 1)
+        self.assertEqual(repository.get_deck_card_quantities(database.get_connection(), result["id"]), {self.card_id: 1})
+
+    def test_copies_are_capped(self):
+        result = deckServer.op_import_code("Too many copies", encode_deck_code({self.card_id: MAX_COPIES + 5}))
+        self.assertEqual(repository.get_deck_card_quantities(database.get_connection(), result["id"]), {self.card_id: MAX_COPIES})
+
+# The untap import of the menu, a deck without any known card is rejected before looking for an identical deck
+class ImportUntapFileTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # an empty stored deck, which an empty imported deck would match by its content hash
+        self.empty_deck_id = repository.save_deck("Stored empty deck", {})
+
+    def write_untap_file(self, lines: list[str]) -> str:
+        file_name = os.path.join(self.folder, "deck.txt")
+        with open(file_name, "w") as file:
+            file.write("//Imported deck\n" + "".join(line + "\n" for line in lines))
+        return file_name
+
+    def assert_not_imported(self, file_name: str) -> None:
+        deck, messages = main.import_untap_file(file_name)
+        self.assertIsNone(deck.id)
+        self.assertEqual(messages[-1], "No known cards in deck 'Imported deck', not imported")
+        self.assertIsNone(repository.resolve_deck_id("Imported deck"))
+
+    def test_file_with_only_unknown_cards_is_rejected(self):
+        self.assert_not_imported(self.write_untap_file(["2 Qzxv Wvqz", "1 Jjjkkk Xxq"]))
+
+    def test_file_without_cards_is_rejected(self):
+        self.assert_not_imported(self.write_untap_file([]))
+
+    def test_known_cards_are_imported(self):
+        card = card_catalog.refresh().all_cards()[0]
+        deck, messages = main.import_untap_file(self.write_untap_file([f"1 {card['name']} (se1)", "2 Qzxv Wvqz"]))
+        self.assertEqual(messages[-1], "Deck 'Imported deck' imported successfully!")
+        self.assertEqual(repository.get_deck_card_quantities(database.get_connection(), deck.id), {card["id"]: 1})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+import os
+import shutil
+import unittest
+
+import database
+import repository
+from cardCatalog import card_catalog
+from databaseTestCase import DatabaseTestCase
+from deckSimilarity import deck_index, numpy_available
+
+@unittest.skipUnless(numpy_available(), "needs numpy")
+class DeckIndexTest(DatabaseTestCase):
+    # PRAGMA data_version is per connection, a new connection to another file can report the same value
+    def test_switching_databases_rebuilds_the_index(self):
+        card_ids = [card["id"] for card in card_catalog.refresh().all_cards()[:2]]
+        other_db_file_name = os.path.join(self.folder, "other.db")
+        shutil.copy(self.db_file_name, other_db_file_name)
+        database.use_database(other_db_file_name)
+        with database.get_connection() as conn:
+            deck_id = repository.write_deck(conn, "Only in the other database", {card_id: 1 for card_id in card_ids})
+        database.use_database(self.db_file_name)
+        self.assertEqual(deck_index.card_quantities(deck_id), {})
+        database.use_database(other_db_file_name)
+        self.assertEqual(deck_index.card_quantities(deck_id), {card_id: 1 for card_id in card_ids})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+import database
+import migrations
+import repository
+from cardCatalog import card_catalog
+from databaseTestCase import DatabaseTestCase
+
+DECK_STATS_QUERY = 'SELECT * FROM deck_stats ORDER BY deck_id'
+
+class MigrationsTest(DatabaseTestCase):
+    def test_the_baseline_schema_is_migrated_to_the_current_version(self):
+        conn = database.open_connection()
+        try:
+            self.assertEqual(migrations.get_schema_version(conn), 0)
+            self.assertEqual(migrations.migrate(conn), len(migrations.MIGRATIONS))
+            tables = {row["name"] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            self.assertTrue({"deck_stats", "cards_fts", "catalog_version", "matches", "matchup_stats"} <= tables)
+            # migrating again is a no-op
+            self.assertEqual(migrations.migrate(conn), len(migrations.MIGRATIONS))
+        finally:
+            conn.close()
+
+class DeckStatsTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cards = card_catalog.refresh().all_cards()
+
+    def assert_deck_stats_match_a_full_recompute(self):
+        conn = database.get_connection()
+        kept = [dict(row) for row in conn.execute(DECK_STATS_QUERY)]
+        with conn:
+            conn.execute(migrations._recompute_deck_stats("1 = 1"))
+            recomputed = [dict(row) for row in conn.execute(DECK_STATS_QUERY)]
+            conn.rollback()
+        self.assertEqual(kept, recomputed)
+
+    def test_deck_stats_follow_inserts_updates_and_deletes(self):
+        first = repository.save_deck("First", {card["id"]: 2 for card in self.cards[:10]})
+        second = repository.save_deck("Second", {card["id"]: 1 for card in self.cards[5:20]})
+        self.assert_deck_stats_match_a_full_recompute()
+
+        changed = {card["id"]: 1 for card in self.cards[2:10]}
+        changed.update({card["id"]: 2 for card in self.cards[30:35]})
+        repository.save_deck("First", changed)
+        self.assert_deck_stats_match_a_full_recompute()
+
+        repository.save_deck("Second", {})
+        self.assert_deck_stats_match_a_full_recompute()
+
+        conn = database.get_connection()
+        with conn:
+            conn.execute('UPDATE decks SET wins = 3, games = 4 WHERE id = ?', (first,))
+            card = self.cards[3]
+            other_type = next(card_type for card_type in migrations._STATS_TYPES if card_type != card["type"])
+            conn.execute('UPDATE cards SET type = ?, madness = ? WHERE id = ?', (other_type, (card["madness"] + 1) % 6, card["id"]))
+        self.assert_deck_stats_match_a_full_recompute()
+
+        repository.delete_deck_by_id(second)
+        self.assert_deck_stats_match_a_full_recompute()
+        self.assertIsNone(repository.get_deck_analysis_by_id(second))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+import database
+import repository
+from cardCatalog import card_catalog
+from databaseTestCase import DatabaseTestCase
+
+class SaveDeckTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cards = card_catalog.refresh().all_cards()
+
+    def deck_card_writes(self, deck_name: str, card_quantities: dict[int, int]) -> list[str]:
+        conn = database.get_connection()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            repository.save_deck(deck_name, card_quantities)
+        finally:
+            conn.set_trace_callback(None)
+        # a statement is traced again for every trigger it fires, and every row written has its own values
+        return [statement for statement in dict.fromkeys(statements)
+                if "deck_cards" in statement and not statement.startswith("SELECT")]
+
+    def test_saving_a_changed_deck_only_writes_the_difference(self):
+        kept, updated, removed, added = self.cards[:20], self.cards[20], self.cards[21], self.cards[22]
+        stored = {card["id"]: 1 for card in kept + [updated, removed]}
+        self.assertEqual(len(self.deck_card_writes("Diffed deck", stored)), len(stored))
+
+        wanted = {card["id"]: 1 for card in kept}
+        wanted[updated["id"]] = 2
+        wanted[added["id"]] = 1
+        writes = self.deck_card_writes("Diffed deck", wanted)
+        self.assertEqual(len(writes), 3)
+        self.assertTrue(any(write.startswith("DELETE") and f"card_id = {removed['id']}" in write for write in writes))
+        self.assertTrue(any(write.startswith("UPDATE") and f"card_id = {updated['id']}" in write for write in writes))
+        self.assertTrue(any(write.startswith("INSERT") and f", {added['id']}, 1)" in write for write in writes))
+
+        conn = database.get_connection()
+        self.assertEqual(repository.get_deck_card_quantities(conn, repository.find_deck_id(conn, "Diffed deck")), wanted)
+        self.assertEqual(self.deck_card_writes("Diffed deck", wanted), [])
+
+if __name__ == "__main__":
+    unittest.main()